@@ -0,0 +1,76 @@
+"""Сборка и поиск локального индекса продуктов на синтетической выгрузке.
+
+    python benchmarks/food_index.py --products 200000
+
+Печатает время сборки, пиковую память процесса и время запроса по типичным
+запросам (целое слово, префикс, несколько слов, бренд).
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils import food_index
+
+ADJECTIVES = ['вкусный', 'домашний', 'свежий', 'белый', 'сладкий', 'тёмный', 'классический',
+              'нежный', 'молочный', 'фермерский', 'organic', 'light', 'extra']
+NOUNS = ['молоко', 'кефир', 'йогурт', 'сыр', 'хлеб', 'гречка', 'рис', 'печенье', 'шоколад',
+         'сок', 'творог', 'колбаса', 'масло', 'мороженое', 'чай', 'кофе', 'банан', 'яблоко']
+BRANDS = ['Простоквашино', 'Домик', 'Лента', 'Danone', 'Nestle', 'Вкуснотеево', 'Савушкин', '']
+QUERIES = ['молоко', 'мол', 'вкусный', 'вкусный молоко', 'гре', 'шоколад danone', 'м', 'нет такого']
+
+
+def write_dump(path, products, seed=1):
+    rnd = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(products):
+            words = rnd.sample(ADJECTIVES, rnd.randint(0, 2)) + [rnd.choice(NOUNS)]
+            if rnd.random() < 0.5:
+                words.append(str(rnd.randint(1, 999)))
+            f.write(json.dumps({
+                'code': str(4600000000000 + i),
+                'product_name': ' '.join(words),
+                'brands': rnd.choice(BRANDS),
+                'nutriments': {'energy-kcal_100g': rnd.randint(20, 600)},
+            }, ensure_ascii=False) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--products', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=200, help="повторов каждого запроса")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='food-index-bench-')
+    dump_path = os.path.join(workdir, 'dump.jsonl')
+    index_path = os.path.join(workdir, 'food_index.bin')
+    write_dump(dump_path, args.products)
+
+    started = time.perf_counter()
+    records, tokens = food_index.build_index(dump_path, index_path)
+    build_time = time.perf_counter() - started
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Сборка: {records} продуктов, {tokens} слов за {build_time:.1f} с, "
+          f"пиковая память {peak_mb:.0f} МБ")
+
+    index = food_index.FoodIndex(index_path)
+    print(f"{'запрос':<20} {'мс':>8}  найдено")
+    for query in QUERIES:
+        index.search(query, 5)
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            results = index.search(query, 5)
+        elapsed = (time.perf_counter() - started) / args.repeat
+        print(f"{query:<20} {elapsed * 1000:>8.3f}  {len(results)}")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Пересчёт норм воды и калорий: цикл по пользователям против пакетных функций.
+
+Проверяет, что пакетные функции дают ровно те же нормы, что и скалярные:
+
+    python benchmarks/goal_batch.py --users 1000000
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.calculations import (
+    calculate_calories_norm, calories_norm_batch, water_norm, water_norm_batch)
+
+
+def make_columns(users, seed):
+    rng = np.random.default_rng(seed)
+    weight = np.round(rng.uniform(40, 150, users), 1)
+    height = np.round(rng.uniform(140, 210, users), 1)
+    age = rng.integers(14, 90, users).astype(np.float64)
+    activity = rng.choice([0, 15, 30, 45, 60, 90, 120], users).astype(np.float64)
+    temp = np.round(rng.uniform(-30, 40, users), 2)
+    # Часть городов без погоды: в скалярной версии это None
+    temp[rng.random(users) < 0.05] = np.nan
+    return weight, height, age, activity, temp
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    weight, height, age, activity, temp = make_columns(args.users, args.seed)
+    # Скалярные функции получают обычные числа Python, как из базы
+    rows = list(zip(weight.tolist(), height.tolist(), age.tolist(), activity.tolist(),
+                    [None if math.isnan(t) else t for t in temp.tolist()]))
+
+    water_loop, water_loop_s = timed(lambda: [water_norm(w, a, t) for w, _, _, a, t in rows])
+    water_vec, water_vec_s = timed(lambda: water_norm_batch(weight, activity, temp))
+    calories_loop, calories_loop_s = timed(
+        lambda: [calculate_calories_norm(w, h, g, a) for w, h, g, a, _ in rows])
+    calories_vec, calories_vec_s = timed(
+        lambda: calories_norm_batch(weight, height, age, activity))
+
+    water_equal = water_vec.tolist() == water_loop
+    calories_equal = calories_vec.tolist() == calories_loop
+
+    print(f"Пользователей: {args.users}")
+    print(f"{'норма':<10} {'цикл, с':>9} {'пакет, с':>9} {'ускорение':>10} {'совпадает':>10}")
+    for name, loop_s, vec_s, equal in (
+            ('вода', water_loop_s, water_vec_s, water_equal),
+            ('калории', calories_loop_s, calories_vec_s, calories_equal)):
+        print(f"{name:<10} {loop_s:>9.3f} {vec_s:>9.3f} {loop_s / vec_s:>9.0f}x {str(equal):>10}")
+
+    if not (water_equal and calories_equal):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
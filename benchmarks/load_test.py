@@ -0,0 +1,202 @@
+"""Нагрузочный тест обработчиков bot.py на синтетических пользователях.
+
+Обработчики вызываются через настоящий Application, внешние API заменены
+локальными заглушками с настраиваемой задержкой и долей ошибок:
+
+    python benchmarks/load_test.py --users 2000 --commands 10
+    python benchmarks/load_test.py --off-latency 0.5 --off-failure 0.1 --json result.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.standins import FOODS, make_update, start_in_process
+
+CITIES = ['Москва', 'Казань', 'Сочи', 'Омск', 'Пермь']
+
+# Доли команд после настройки профиля
+COMMAND_MIX = [
+    ('log_water', 0.3),
+    ('log_code', 0.05),
+    ('log_food', 0.2),
+    ('food_search', 0.1),
+    ('check_progress', 0.2),
+    ('profile', 0.05),
+    ('log_workout', 0.05),
+    ('weather', 0.05),
+]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def command_text(command, rnd):
+    food = rnd.choice(list(FOODS))
+    if command == 'log_water':
+        return f"/log_water {rnd.choice((100, 200, 250, 500))}"
+    if command == 'log_food':
+        return f"/log_food {food} {rnd.randint(50, 300)}"
+    if command == 'log_code':
+        # Коды продуктов заглушки и изредка неизвестный код
+        return f"/log_code 460{rnd.randint(0, len(FOODS)):010d} {rnd.randint(50, 300)}"
+    if command == 'food_search':
+        return f"/food_search {food}"
+    if command == 'log_workout':
+        return f"/log_workout бег {rnd.choice((20, 30, 45, 60))}"
+    if command == 'weather':
+        return f"/weather {rnd.choice(CITIES)}"
+    return f"/{command}"
+
+
+def user_script(user_id, commands, rnd):
+    """Сценарий одного пользователя: диалог /set_profile, затем смесь команд"""
+    yield 'set_profile', '/set_profile'
+    for text in (str(rnd.randint(50, 110)), str(rnd.randint(155, 195)),
+                 str(rnd.randint(18, 70)), str(rnd.choice((0, 30, 60))), rnd.choice(CITIES)):
+        yield 'set_profile', text
+
+    names = [name for name, _ in COMMAND_MIX]
+    weights = [weight for _, weight in COMMAND_MIX]
+    for command in rnd.choices(names, weights, k=commands):
+        yield command, command_text(command, rnd)
+
+
+async def run(args):
+    standins = await start_in_process(
+        off_latency=args.off_latency, off_failure=args.off_failure,
+        owm_latency=args.owm_latency, owm_failure=args.owm_failure,
+        tg_latency=args.tg_latency)
+
+    workdir = tempfile.mkdtemp(prefix='bot-bench-')
+    os.environ.update(standins.env())
+    os.environ.setdefault('TELEGRAM_BOT_TOKEN', '1:bench')
+    os.environ['USERS_DB_PATH'] = os.path.join(workdir, 'users.db')
+    os.environ['PERSISTENCE_DB_PATH'] = os.path.join(workdir, 'state.db')
+    os.environ['BARCODES_DB_PATH'] = os.path.join(workdir, 'barcodes.db')
+    os.environ['FOOD_INDEX_PATH'] = os.path.join(workdir, 'no_index.bin')
+
+    import bot
+    from telegram import Update
+    from telegram.ext import Application
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    application = bot.build_application(updater=False)
+    await application.initialize()
+    await bot.post_init(application)
+    await application.start()
+
+    latencies = {}
+    errors = {}
+    failed = set()
+    update_ids = iter(range(1, 10 ** 9))
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async def count_error(update, context):
+        # process_update не пробрасывает исключения обработчиков, а передаёт их сюда
+        if isinstance(update, Update):
+            failed.add(update.update_id)
+
+    application.add_error_handler(count_error)
+
+    async def simulate(user_id):
+        rnd = random.Random(user_id)
+        async with slots:
+            for command, text in user_script(user_id, args.commands, rnd):
+                update = Update.de_json(
+                    make_update(next(update_ids), user_id, text), application.bot)
+                started = time.perf_counter()
+                # Сам обработчик, минуя очередь диспетчера, чтобы мерить ответ
+                await Application.process_update(application, update)
+                latencies.setdefault(command, []).append(time.perf_counter() - started)
+                if update.update_id in failed:
+                    failed.discard(update.update_id)
+                    errors[command] = errors.get(command, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(simulate(1_000_000 + i) for i in range(args.users)))
+    elapsed = time.perf_counter() - started
+
+    await application.stop()
+    await application.shutdown()
+    await bot.post_shutdown(application)
+    if args.metrics:
+        from utils import metrics
+        metrics.dump(args.metrics)
+    upstream_calls = standins.calls
+    await standins.stop()
+
+    total = sum(len(values) for values in latencies.values())
+    report = {
+        'users': args.users,
+        'updates': total,
+        'elapsed_s': elapsed,
+        'throughput_per_s': total / elapsed,
+        'errors': sum(errors.values()),
+        'upstream_calls': upstream_calls,
+        'commands': {},
+    }
+    for command, values in sorted(latencies.items()):
+        values.sort()
+        report['commands'][command] = {
+            'count': len(values),
+            'errors': errors.get(command, 0),
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+        }
+    return report
+
+
+def print_report(report):
+    print(f"Пользователей: {report['users']}, обновлений: {report['updates']}, "
+          f"время: {report['elapsed_s']:.1f} с, "
+          f"пропускная способность: {report['throughput_per_s']:.0f} обновл./с, "
+          f"ошибок: {report['errors']}")
+    print(f"Запросов к заглушкам: {report['upstream_calls']}")
+    print(f"{'команда':<16} {'кол-во':>7} {'ошибок':>7} "
+          f"{'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9}")
+    for command, row in report['commands'].items():
+        print(f"{command:<16} {row['count']:>7} {row['errors']:>7} {row['p50_ms']:>9.1f} "
+              f"{row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--commands', type=int, default=10, help="команд на пользователя")
+    parser.add_argument('--concurrency', type=int, default=500,
+                        help="сколько пользователей активны одновременно")
+    parser.add_argument('--off-latency', type=float, default=0.2)
+    parser.add_argument('--off-failure', type=float, default=0.0)
+    parser.add_argument('--owm-latency', type=float, default=0.1)
+    parser.add_argument('--owm-failure', type=float, default=0.0)
+    parser.add_argument('--tg-latency', type=float, default=0.02)
+    parser.add_argument('--json', help="сохранить отчёт в файл")
+    parser.add_argument('--metrics', help="сохранить метрики бота в формате Prometheus")
+    parser.add_argument('--verbose', action='store_true', help="не глушить INFO-логи бота")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
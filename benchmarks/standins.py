@@ -0,0 +1,202 @@
+"""Локальные заглушки OpenFoodFacts, OpenWeatherMap и Telegram Bot API.
+
+Каждая заглушка отвечает с заданной задержкой и долей ошибок (HTTP 503).
+Чтобы заглушки не делили процессор с ботом, их можно запустить в отдельном
+процессе через start_in_process().
+"""
+import asyncio
+import itertools
+import json
+import multiprocessing
+import random
+import socket
+import time
+import urllib.request
+
+from aiohttp import web
+
+FOODS = {
+    'банан': 89, 'гречка': 313, 'молоко': 58, 'яблоко': 52, 'курица': 165,
+    'рис': 344, 'хлеб': 265, 'йогурт': 59, 'творог': 121, 'сыр': 350,
+}
+
+
+class StandIns:
+    def __init__(self, port=0, off_latency=0.2, off_failure=0.0,
+                 owm_latency=0.1, owm_failure=0.0, tg_latency=0.02, seed=1):
+        self.port = port
+        self.off_latency = off_latency
+        self.off_failure = off_failure
+        self.owm_latency = owm_latency
+        self.owm_failure = owm_failure
+        self.tg_latency = tg_latency
+        self.random = random.Random(seed)
+        self.calls = {'openfoodfacts': 0, 'openweathermap': 0, 'telegram': 0}
+        # Обновления, которые отдаст getUpdates (для замера старта)
+        self.pending_updates = []
+        self.first_send_at = None
+        self._message_ids = itertools.count(1)
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.router.add_get('/cgi/search.pl', self._openfoodfacts)
+        self.app.router.add_get('/api/v2/product/{code}.json', self._openfoodfacts_product)
+        self.app.router.add_get('/data/2.5/weather', self._openweathermap)
+        self.app.router.add_post('/bot{token}/{method}', self._telegram)
+        self.app.router.add_get('/stats', self._stats)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def env(self):
+        """Переменные окружения, направляющие бота на заглушки"""
+        return {
+            'TELEGRAM_API_URL': f"{self.base_url}/bot",
+            'OPENFOODFACTS_URL': f"{self.base_url}/cgi/search.pl",
+            'OPENFOODFACTS_PRODUCT_URL': f"{self.base_url}/api/v2/product",
+            'OPENWEATHER_URL': f"{self.base_url}/data/2.5/weather",
+            'OPENWEATHER_API_KEY': 'stand-in',
+        }
+
+    async def _delay(self, latency, failure):
+        # Экспоненциальный хвост вокруг средней задержки
+        await asyncio.sleep(self.random.expovariate(1 / latency) if latency else 0)
+        return self.random.random() < failure
+
+    async def _openfoodfacts(self, request):
+        self.calls['openfoodfacts'] += 1
+        if await self._delay(self.off_latency, self.off_failure):
+            return web.Response(status=503)
+
+        query = request.query.get('search_terms', '').lower()
+        page_size = int(request.query.get('page_size', 3))
+        products = [
+            {'code': f"460{i:010d}", 'product_name': f"{name.capitalize()} {i}",
+             'brands': 'Заглушка', 'nutriments': {'energy-kcal_100g': kcal + i}}
+            for i, (name, kcal) in enumerate(FOODS.items()) if name.startswith(query[:3])
+        ]
+        return web.json_response({'products': products[:page_size]})
+
+    async def _openfoodfacts_product(self, request):
+        self.calls['openfoodfacts'] += 1
+        if await self._delay(self.off_latency, self.off_failure):
+            return web.Response(status=503)
+
+        code = request.match_info['code']
+        foods = list(FOODS.items())
+        i = int(code[3:]) if code.startswith('460') else len(foods)
+        if i >= len(foods):
+            return web.json_response({'status': 0, 'status_verbose': 'product not found'}, status=404)
+        name, kcal = foods[i]
+        return web.json_response({'status': 1, 'code': code, 'product': {
+            'code': code, 'product_name': f"{name.capitalize()} {i}",
+            'brands': 'Заглушка', 'nutriments': {'energy-kcal_100g': kcal + i}}})
+
+    async def _openweathermap(self, request):
+        self.calls['openweathermap'] += 1
+        if await self._delay(self.owm_latency, self.owm_failure):
+            return web.Response(status=503)
+        city = request.query.get('q', '')
+        return web.json_response({
+            'name': city,
+            'main': {'temp': 15 + sum(map(ord, city)) % 20},
+            'timezone': 10800
+        })
+
+    async def _stats(self, request):
+        return web.json_response(self.calls)
+
+    async def _telegram(self, request):
+        self.calls['telegram'] += 1
+        method = request.match_info['method']
+        if method == 'getMe':
+            return web.json_response({'ok': True, 'result': {
+                'id': 1, 'is_bot': True, 'first_name': 'bench', 'username': 'bench_bot'}})
+        if method == 'getUpdates':
+            if self.pending_updates:
+                updates, self.pending_updates = self.pending_updates, []
+                return web.json_response({'ok': True, 'result': updates})
+            await asyncio.sleep(0.5)
+            return web.json_response({'ok': True, 'result': []})
+        if method in ('deleteWebhook', 'setWebhook', 'setMyCommands', 'answerInlineQuery'):
+            return web.json_response({'ok': True, 'result': True})
+
+        data = await request.post()
+        await asyncio.sleep(self.tg_latency)
+        if self.first_send_at is None:
+            self.first_send_at = time.perf_counter()
+        chat_id = int(data.get('chat_id', 0))
+        return web.json_response({'ok': True, 'result': {
+            'message_id': next(self._message_ids), 'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'}, 'text': data.get('text', '')}})
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+def make_update(update_id, user_id, text):
+    """Словарь обновления Telegram с текстовым сообщением от пользователя"""
+    message = {
+        'message_id': update_id, 'date': int(time.time()), 'text': text,
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}"},
+    }
+    if text.startswith('/'):
+        message['entities'] = [
+            {'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+def _serve(port, kwargs):
+    async def serve():
+        await StandIns(port=port, **kwargs).start()
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+class StandInsProcess:
+    """Заглушки в отдельном процессе; интерфейс как у StandIns"""
+
+    def __init__(self, **kwargs):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            self.port = sock.getsockname()[1]
+        self._process = multiprocessing.get_context('spawn').Process(
+            target=_serve, args=(self.port, kwargs), daemon=True)
+
+    base_url = StandIns.base_url
+    env = StandIns.env
+
+    @property
+    def calls(self):
+        with urllib.request.urlopen(f"{self.base_url}/stats") as response:
+            return json.load(response)
+
+    async def start(self):
+        self._process.start()
+        for _ in range(100):
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=0.1).close()
+                return self
+            except OSError:
+                await asyncio.sleep(0.05)
+        raise RuntimeError("Заглушки не запустились")
+
+    async def stop(self):
+        self._process.terminate()
+        self._process.join()
+
+
+def start_in_process(**kwargs):
+    return StandInsProcess(**kwargs).start()
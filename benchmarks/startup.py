@@ -0,0 +1,112 @@
+"""Время холодного старта bot.py: импорт и время до ответа на первое обновление.
+
+Бот запускается отдельным процессом в режиме polling против заглушек Bot API;
+заглушка сразу отдаёт одно обновление /start, замеряется время от запуска
+процесса до первого sendMessage:
+
+    python benchmarks/startup.py --runs 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.standins import StandIns, make_update
+
+
+def bot_env(standins, workdir):
+    env = dict(os.environ)
+    env.update(standins.env())
+    env.update({
+        'TELEGRAM_BOT_TOKEN': env.get('TELEGRAM_BOT_TOKEN', '1:bench'),
+        'USERS_DB_PATH': os.path.join(workdir, 'users.db'),
+        'PERSISTENCE_DB_PATH': os.path.join(workdir, 'state.db'),
+        'BARCODES_DB_PATH': os.path.join(workdir, 'barcodes.db'),
+        'FOOD_INDEX_PATH': os.path.join(workdir, 'no_index.bin'),
+        'LOG_LEVEL': 'WARNING',
+        'BOT_MODE': 'polling',
+    })
+    return env
+
+
+async def measure_import(env):
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, '-c', 'import bot', cwd=ROOT, env=env)
+    await process.wait()
+    return time.perf_counter() - started
+
+
+async def measure_first_update(standins, env, timeout):
+    standins.first_send_at = None
+    standins.pending_updates = [make_update(1, 42, '/start')]
+
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(ROOT, 'bot.py'), cwd=ROOT, env=env)
+    try:
+        deadline = started + timeout
+        while standins.first_send_at is None:
+            if time.perf_counter() > deadline or process.returncode is not None:
+                raise RuntimeError("Бот не ответил на первое обновление")
+            await asyncio.sleep(0.002)
+        return standins.first_send_at - started
+    finally:
+        if process.returncode is None:
+            process.send_signal(signal.SIGINT)
+        await process.wait()
+
+
+async def run(args):
+    # Задержка Bot API нулевая: меряем старт бота, а не сеть
+    standins = await StandIns(tg_latency=0).start()
+    workdir = tempfile.mkdtemp(prefix='bot-startup-')
+    env = bot_env(standins, workdir)
+
+    # Прогон без замера: байт-код в __pycache__, файлы в кэше ОС
+    await measure_import(env)
+
+    imports, first_updates = [], []
+    for _ in range(args.runs):
+        imports.append(await measure_import(env))
+        first_updates.append(await measure_first_update(standins, env, args.timeout))
+    await standins.stop()
+
+    def summary(values):
+        return {'median_ms': statistics.median(values) * 1000, 'min_ms': min(values) * 1000}
+
+    return {
+        'runs': args.runs,
+        'import': summary(imports),
+        'time_to_first_update': summary(first_updates),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--timeout', type=float, default=30, help="ожидание первого ответа, сек")
+    parser.add_argument('--json', help="сохранить отчёт в файл")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(f"Запусков: {report['runs']}")
+    print(f"{'этап':<24} {'медиана, мс':>12} {'мин., мс':>10}")
+    for name, key in (('импорт bot.py', 'import'), ('до первого ответа', 'time_to_first_update')):
+        row = report[key]
+        print(f"{name:<24} {row['median_ms']:>12.0f} {row['min_ms']:>10.0f}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Память на пользователя: словарь из bot.py против UserRecord.
+
+    python benchmarks/user_memory.py            # 10k, 100k, 1M
+    python benchmarks/user_memory.py 10000 50000
+"""
+import gc
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.user_record
+from utils.user_record import UserRecord, CityTable
+
+CITIES = ['Москва', 'Санкт-Петербург', 'Казань', 'Новосибирск', 'Екатеринбург',
+          'Нижний Новгород', 'Самара', 'Омск', 'Ростов-на-Дону', 'Уфа']
+
+
+def synthetic_users(n, seed=42):
+    rnd = random.Random(seed)
+    for user_id in range(n):
+        # Город приходит из сообщения, поэтому у каждого пользователя своя строка
+        city = rnd.choice(CITIES).encode().decode()
+        yield user_id, (
+            float(rnd.randint(45, 120)), float(rnd.randint(150, 200)),
+            rnd.randint(16, 80), float(rnd.choice((0, 15, 30, 45, 60, 90))), city,
+            rnd.randint(2000, 4500), rnd.uniform(1500, 3500),
+            float(rnd.randint(0, 3000)), rnd.uniform(0, 3000), rnd.uniform(0, 800)
+        )
+
+
+def as_dict(values):
+    (weight, height, age, activity, city, water_goal, calorie_goal,
+     logged_water, logged_calories, burned_calories) = values
+    return {
+        "weight": weight, "height": height, "age": age, "activity": activity,
+        "city": city, "water_goal": water_goal, "calorie_goal": calorie_goal,
+        "logged_water": logged_water, "logged_calories": logged_calories,
+        "burned_calories": burned_calories
+    }
+
+
+def measure(n, make):
+    """Байт на пользователя вместе со значениями полей и ключом словаря users"""
+    utils.user_record.cities = CityTable()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    users = {user_id: make(values) for user_id, values in synthetic_users(n)}
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del users
+    return used / n
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    print(f"{'пользователей':>14} {'dict, Б':>10} {'UserRecord, Б':>14} {'экономия':>9}")
+    for n in sizes:
+        dict_bytes = measure(n, as_dict)
+        record_bytes = measure(n, lambda values: UserRecord(**as_dict(values)))
+        print(f"{n:>14} {dict_bytes:>10.0f} {record_bytes:>14.0f} "
+              f"{1 - record_bytes / dict_bytes:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
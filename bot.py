@@ -1,105 +1,83 @@
+import asyncio
 import logging
-import requests
+import multiprocessing
+import signal
 import sys
 import os
-from telegram import Update
+from telegram import InlineQueryResultArticle, InputTextMessageContent, Update
+from telegram.error import TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
+    InlineQueryHandler,
     MessageHandler,
     filters,
     ContextTypes,
     ConversationHandler
 )
-from telegram.ext import MessageHandler, filters
 from dotenv import load_dotenv
 load_dotenv()
 
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+from utils.log import setup_logging
+
+setup_logging()
 logger = logging.getLogger(__name__)
 
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+# Адрес Bot API; можно заменить на локальный сервер или заглушку
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+# polling, webhook (один процесс) или sharded
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Для sharded: число процессов-обработчиков и откуда фронт берёт обновления
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", os.cpu_count() or 1))
+SHARDED_INPUT = os.getenv("SHARDED_INPUT", "polling")
+# Сколько обработчик может ждать внешние API, прежде чем ответить запасным вариантом, сек
+FOOD_BUDGET = float(os.getenv("FOOD_BUDGET", 3))
+WEATHER_BUDGET = float(os.getenv("WEATHER_BUDGET", 2))
 
 if not TOKEN:
     logger.error("TELEGRAM_BOT_TOKEN не установлен!")
     sys.exit(1)
 
-
-try:
-    from utils.calculations import calculate_water_norm, calculate_calories_norm, get_temperature
-    from utils.food_api import get_food_info_openfoodfacts, get_average_calories
-except ImportError:
-    def calculate_water_norm(weight, activity, city):
-        base = weight * 30
-        activity_water = (activity // 30) * 500
-        temp = get_temperature(city) if 'get_temperature' in globals() else 20
-        weather_water = 500 if temp and temp > 25 else 0
-        return int(base + activity_water + weather_water)
-
-    def calculate_calories_norm(weight, height, age, activity):
-        base = 10 * weight + 6.25 * height - 5 * age
-        activity_factor = 1.2 + (activity / 60) * 0.1
-        daily_calories = base * activity_factor
-        activity_calories = activity * 7
-        return daily_calories + activity_calories
-
-    def get_temperature(city):
-        """функция получения температуры из OpenWeatherMap"""
-        api_key = os.getenv("OPENWEATHER_API_KEY")
-        if not api_key:
-            logger.error("OPENWEATHER_API_KEY не установлен в .env файле!")
-            return None
-
-        try:
-            url = f"http://api.openweathermap.org/data/2.5/weather"
-            params = {
-                'q': city,
-                'appid': api_key,
-                'units': 'metric',  # градусы Цельсия
-                'lang': 'ru'
-            }
-
-            response = requests.get(url, params=params, timeout=5)
-
-            if response.status_code == 200:
-                data = response.json()
-                temp = data['main']['temp']
-                logger.info(f"Получена температура для {city}: {temp}°C")
-                return temp
-            else:
-                logger.error(
-                    f"Ошибка API OpenWeatherMap: {response.status_code}")
-                return None
-
-        except requests.exceptions.Timeout:
-            logger.error(" Таймаут при запросе погоды")
-            return None
-        except Exception as e:
-            logger.error(f" Ошибка получения температуры: {e}")
-            return None
-
-    def get_food_info_openfoodfacts(food):
-        calories = get_average_calories(food)
-        return (calories, food, 100)
-
-    def get_average_calories(food):
-        calories_db = {
-            'яблоко': 52, 'банан': 89, 'гречка': 132, 'курица': 165,
-            'рис': 130, 'хлеб': 265, 'молоко': 42, 'йогурт': 59,
-            'яйцо': 155, 'рыба': 206, 'говядина': 250, 'картофель': 77
-        }
-        return calories_db.get(food.lower(), 250)
-
-users = {}
+from utils import metrics
+from utils.calculations import calculate_calories_norm, get_temperature, get_weather, water_norm
+from utils.deadline import with_budget
+from utils.dispatch import UserOrderedApplication, BOT_CONCURRENCY
+from utils.barcodes import close_barcodes, valid_code
+from utils.food_api import get_average_calories, get_food_by_code, resolve_food, search_food_products
+from utils.food_index import load_index
+from utils.food_reference import get_reference
+from utils.http import close_session, get_session
+from utils.inline_search import inline_search
+from utils.metrics import timed_handler
+from utils.outbound import OutboundQueue
+from utils.persistence import SQLitePersistence
+from utils.reminders import Reminders, REMINDER_START_HOUR, REMINDER_END_HOUR
+from utils.stats import user_stats
+from utils.singleflight import cancel_all as cancel_flights
+from utils.tg_request import InstrumentedRequest
+from utils.storage import UserStore, WATER, FOOD, BURNED, EXTRA_WATER
+from utils.user_record import DEFAULT_TZ_OFFSET
+from utils.weather_refresh import WeatherRefresher
+
+store = UserStore()
+weather_refresher = WeatherRefresher(store)
+outbound = OutboundQueue()
+reminders = Reminders(store, outbound)
+# Заблокировавшим бота больше не напоминаем
+outbound.on_forbidden = reminders.disable
 WEIGHT, HEIGHT, AGE, ACTIVITY, CITY = range(5)
+FOOD_SOURCES = {
+    'reference': "(справочник)",
+    'openfoodfacts': "(данные из базы OpenFoodFacts)",
+    'average': "(среднее значение)",
+}
 
 
+@timed_handler
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "Привет! Я бот для расчета норм воды и калорий.\n"
@@ -107,6 +85,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+@timed_handler
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     help_text = """
 Основные команды:
@@ -114,24 +93,31 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /profile - Показать данные профиля
 /log_water <количество> - Записать выпитую воду (в мл)
 /log_food <продукт> - Записать съеденную еду 
+/log_code <штрихкод> <граммы> - Записать продукт по штрихкоду
 /log_workout <тип> <время> - Записать тренировку
 /check_progress - Проверить прогресс
+/stats - Статистика за 7, 30 и 90 дней
 /weather - Погода 
 /food_search - Поиск продукта 
+/reminders on|off - Напоминания пить воду
 
 Примеры:
 /log_water 500
-/log_food банан
+/log_food банан 150
+/log_food банан 150; гречка 200; молоко 250
+/log_code 4600000000001 200
 /log_workout бег 30
 """
     await update.message.reply_text(help_text)
 
 
+@timed_handler
 async def set_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Настройка профиля. Введите ваш вес в кг:")
     return WEIGHT
 
 
+@timed_handler
 async def weight_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         weight = float(update.message.text)
@@ -143,6 +129,7 @@ async def weight_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return WEIGHT
 
 
+@timed_handler
 async def height_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         height = float(update.message.text)
@@ -154,6 +141,7 @@ async def height_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return HEIGHT
 
 
+@timed_handler
 async def age_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         age = int(update.message.text)
@@ -165,6 +153,7 @@ async def age_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return AGE
 
 
+@timed_handler
 async def activity_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         activity = float(update.message.text)
@@ -176,56 +165,64 @@ async def activity_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ACTIVITY
 
 
+@timed_handler
+@with_budget(WEATHER_BUDGET)
 async def city_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
     city = update.message.text
     user_id = update.effective_user.id
 
-    users[user_id] = {
+    weather = await get_weather(city)
+    tz_offset = DEFAULT_TZ_OFFSET
+    if weather and weather.get('timezone') is not None:
+        tz_offset = weather['timezone']
+
+    profile = {
         "weight": context.user_data['weight'],
         "height": context.user_data['height'],
         "age": context.user_data['age'],
         "activity": context.user_data['activity'],
         "city": city,
-        "water_goal": 0,
-        "calorie_goal": 0,
-        "logged_water": 0,
-        "logged_calories": 0,
-        "burned_calories": 0
+        "tz_offset": tz_offset
     }
 
-    users[user_id]['water_goal'] = calculate_water_norm(
-        users[user_id]['weight'],
-        users[user_id]['activity'],
-        users[user_id]['city']
+    # Температура из уже полученной погоды: второй запрос не нужен
+    profile['water_goal'] = water_norm(
+        profile['weight'],
+        profile['activity'],
+        weather and weather['temp']
     )
 
-    users[user_id]['calorie_goal'] = calculate_calories_norm(
-        users[user_id]['weight'],
-        users[user_id]['height'],
-        users[user_id]['age'],
-        users[user_id]['activity']
+    profile['calorie_goal'] = calculate_calories_norm(
+        profile['weight'],
+        profile['height'],
+        profile['age'],
+        profile['activity']
     )
 
+    user = await store.save_profile(user_id, profile)
+
     response = f"""
 Профиль сохранен.
 
 Ваши нормы:
-Вода: {users[user_id]['water_goal']} мл/день
-Калории: {users[user_id]['calorie_goal']:.0f} ккал/день
+Вода: {user.water_goal} мл/день
+Калории: {user.calorie_goal:.0f} ккал/день
 """
     await update.message.reply_text(response)
     return ConversationHandler.END
 
 
+@timed_handler
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Настройка профиля отменена.")
     return ConversationHandler.END
 
 
+@timed_handler
 async def log_water(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
 
-    if user_id not in users:
+    if await store.get(user_id) is None:
         await update.message.reply_text("Сначала настройте профиль: /set_profile")
         return
 
@@ -235,30 +232,31 @@ async def log_water(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         water_amount = float(context.args[0])
-        users[user_id]['logged_water'] += water_amount
+        user = await store.record(user_id, WATER, water_amount)
 
-        remaining = users[user_id]['water_goal'] - \
-            users[user_id]['logged_water']
+        remaining = user.day_water_goal - user.logged_water
 
         await update.message.reply_text(
             f"Записано: {water_amount} мл воды\n"
-            f"Выпито всего: {users[user_id]['logged_water']} мл\n"
+            f"Выпито всего: {user.logged_water} мл\n"
             f"Осталось до цели: {remaining if remaining > 0 else 0} мл"
         )
     except ValueError:
         await update.message.reply_text("Введите число (например: /log_water 500)")
 
 
+@timed_handler
+@with_budget(FOOD_BUDGET)
 async def log_food(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
 
-    if user_id not in users:
+    if await store.get(user_id) is None:
         await update.message.reply_text("Сначала настройте профиль: /set_profile")
         return
 
     if not context.args:
         await update.message.reply_text("Использование: /log_food <продукт> <граммы>")
-        await update.message.reply_text("Пример: /log_food банан 150")
+        await update.message.reply_text("Пример: /log_food банан 150\nИли сразу несколько: /log_food банан 150; гречка 200")
         return
 
     # Если первым аргументом число - используем результаты поиска
@@ -278,7 +276,7 @@ async def log_food(update: Update, context: ContextTypes.DEFAULT_TYPE):
             product_name = product['name']
 
             calories = (calories_per_100g / 100) * weight_grams
-            users[user_id]['logged_calories'] += calories
+            await store.record(user_id, FOOD, calories)
 
             await update.message.reply_text(
                 f"Записано из базы OpenFoodFacts!\n"
@@ -291,29 +289,24 @@ async def log_food(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("Используйте: /log_food <номер> <граммы>")
             return
 
+    text = ' '.join(context.args)
+    if ';' in text:
+        await log_meal(update, user_id, text)
+        return
+
     # Обычный режим
     food_name = ' '.join(context.args[:-1])
     try:
         weight_grams = float(context.args[-1])
 
-        await update.message.reply_text(f"Ищу '{food_name}' в базе OpenFoodFacts...")
-
-        calories_per_100g, product_name, _ = get_food_info_openfoodfacts(
-            food_name)
-
-        if not calories_per_100g:
-            calories_per_100g = get_average_calories(food_name)
-            product_name = food_name
-            source = "(среднее значение)"
-        else:
-            source = "(данные из базы OpenFoodFacts)"
+        calories_per_100g, product_name, source = await resolve_food(food_name)
 
         calories = (calories_per_100g / 100) * weight_grams
-        users[user_id]['logged_calories'] += calories
+        await store.record(user_id, FOOD, calories)
 
         await update.message.reply_text(
             f"Записано!\n"
-            f"{product_name} {source}\n"
+            f"{product_name} {FOOD_SOURCES[source]}\n"
             f"{weight_grams}г = {calories:.1f} ккал\n"
             f"Калорийность: {calories_per_100g} ккал/100г"
         )
@@ -324,6 +317,85 @@ async def log_food(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Используйте: /log_food <продукт> <граммы>")
 
 
+async def log_meal(update: Update, user_id, text):
+    """/log_food банан 150; гречка 200 — все продукты ищутся одновременно,
+    записываются разом и подтверждаются одним сообщением"""
+    items = []
+    for part in text.split(';'):
+        words = part.split()
+        if not words:
+            continue
+        try:
+            if len(words) < 2:
+                raise ValueError
+            items.append((' '.join(words[:-1]), float(words[-1])))
+        except ValueError:
+            await update.message.reply_text(
+                f"Не понял «{part.strip()}».\n"
+                "Используйте: /log_food <продукт> <граммы>; <продукт> <граммы>"
+            )
+            return
+
+    if not items:
+        # «/log_food ;» — только разделители, записывать нечего
+        await update.message.reply_text("Использование: /log_food <продукт> <граммы>; <продукт> <граммы>")
+        return
+
+    resolved = await asyncio.gather(*(resolve_food(food_name) for food_name, _ in items))
+
+    lines = []
+    events = []
+    total = 0
+    for (_, weight_grams), (calories_per_100g, product_name, source) in zip(items, resolved):
+        calories = (calories_per_100g / 100) * weight_grams
+        events.append((FOOD, calories))
+        total += calories
+        lines.append(f"{product_name} {FOOD_SOURCES[source]}: {weight_grams}г = {calories:.1f} ккал")
+
+    await store.record_many(user_id, events)
+
+    await update.message.reply_text(
+        f"Записано продуктов: {len(items)}\n" + '\n'.join(lines) + f"\nИтого: {total:.1f} ккал"
+    )
+
+
+@timed_handler
+@with_budget(FOOD_BUDGET)
+async def log_code(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+
+    if await store.get(user_id) is None:
+        await update.message.reply_text("Сначала настройте профиль: /set_profile")
+        return
+
+    try:
+        code, weight_grams = context.args[0], float(context.args[1])
+        if not valid_code(code):
+            raise ValueError
+    except (IndexError, ValueError):
+        await update.message.reply_text("Используйте: /log_code <штрихкод> <граммы>")
+        return
+
+    calories_per_100g, product_name = await get_food_by_code(code)
+    if not calories_per_100g:
+        await update.message.reply_text(
+            f"Продукт со штрихкодом {code} не найден.\n"
+            "Попробуйте /log_food <продукт> <граммы>"
+        )
+        return
+
+    calories = (calories_per_100g / 100) * weight_grams
+    await store.record(user_id, FOOD, calories)
+
+    await update.message.reply_text(
+        f"Записано!\n"
+        f"{product_name}\n"
+        f"{weight_grams}г = {calories:.1f} ккал\n"
+        f"Калорийность: {calories_per_100g:.1f} ккал/100г"
+    )
+
+
+@timed_handler
 async def food_weight_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         weight_grams = float(update.message.text)
@@ -336,7 +408,7 @@ async def food_weight_received(update: Update, context: ContextTypes.DEFAULT_TYP
 
         calories = (food_data['calories_per_100g'] / 100) * weight_grams
 
-        users[user_id]['logged_calories'] += calories
+        await store.record(user_id, FOOD, calories)
 
         await update.message.reply_text(f"Записано: {calories:.1f} ккал.")
 
@@ -349,10 +421,11 @@ async def food_weight_received(update: Update, context: ContextTypes.DEFAULT_TYP
         return 'WAITING_FOOD_WEIGHT'
 
 
+@timed_handler
 async def log_workout(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
 
-    if user_id not in users:
+    if await store.get(user_id) is None:
         await update.message.reply_text("Сначала настройте профиль: /set_profile")
         return
 
@@ -373,8 +446,7 @@ async def log_workout(update: Update, context: ContextTypes.DEFAULT_TYPE):
         burned = calories_per_min * minutes
         water_additional = (minutes // 30) * 200
 
-        users[user_id]['burned_calories'] += burned
-        users[user_id]['water_goal'] += water_additional
+        await store.record_many(user_id, [(BURNED, burned), (EXTRA_WATER, water_additional)])
 
         await update.message.reply_text(
             f"{workout_type} {minutes} минут\n"
@@ -385,36 +457,87 @@ async def log_workout(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Время должно быть числом")
 
 
+@timed_handler
 async def check_progress(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
 
-    if user_id not in users:
+    user = await store.get(user_id)
+    if user is None:
         await update.message.reply_text("Сначала настройте профиль: /set_profile")
         return
-
-    user = users[user_id]
-    water_remaining = max(0, user['water_goal'] - user['logged_water'])
-    calorie_balance = user['logged_calories'] - user['burned_calories']
+    water_remaining = max(0, user.day_water_goal - user.logged_water)
+    calorie_balance = user.logged_calories - user.burned_calories
 
     progress_text = f"""
 Прогресс:
 
 Вода:
-- Выпито: {user['logged_water']} мл из {user['water_goal']} мл
+- Выпито: {user.logged_water} мл из {user.day_water_goal} мл
 - Осталось: {water_remaining} мл
 
 Калории:
-- Потреблено: {user['logged_calories']} ккал
-- Сожжено: {user['burned_calories']} ккал
+- Потреблено: {user.logged_calories} ккал
+- Сожжено: {user.burned_calories} ккал
 - Баланс: {calorie_balance:.0f} ккал
 """
 
-    if 'calorie_goal' in user:
-        progress_text += f"- Цель: {user['calorie_goal']} ккал\n"
+    progress_text += f"- Цель: {user.calorie_goal} ккал\n"
 
     await update.message.reply_text(progress_text)
 
 
+@timed_handler
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+
+    user = await store.get(user_id)
+    if user is None:
+        await update.message.reply_text("Сначала настройте профиль: /set_profile")
+        return
+
+    summaries, streak, best_streak = await user_stats(store, user_id, user)
+
+    stats_text = "Статистика\n"
+    for summary in summaries:
+        days = summary['days']
+        stats_text += f"""
+За {days} дней (дней с записями: {summary['active_days']}):
+- Вода: {summary['water_avg']:.0f} мл/день, норма выполнена {summary['water_hits']} из {days} дней
+- Калории: {summary['calories_avg']:.0f} ккал/день, сожжено {summary['burned_avg']:.0f} ккал/день
+- В пределах цели по калориям: {summary['calorie_hits']} из {days} дней
+"""
+
+    stats_text += f"\nНорма воды выполнена подряд: {streak} дн. (лучшая серия: {best_streak} дн.)"
+
+    await update.message.reply_text(stats_text)
+
+
+@timed_handler
+async def reminders_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+
+    if await store.get(user_id) is None:
+        await update.message.reply_text("Сначала настройте профиль: /set_profile")
+        return
+
+    mode = context.args[0].lower() if context.args else ''
+    if mode in ('on', 'вкл'):
+        await reminders.enable(user_id)
+        await update.message.reply_text(
+            f"Напоминания включены: с {REMINDER_START_HOUR}:00 до {REMINDER_END_HOUR}:00 "
+            f"по вашему времени, если вы отстаёте от нормы воды.\n"
+            f"Отключить: /reminders off"
+        )
+    elif mode in ('off', 'выкл'):
+        await reminders.disable(user_id)
+        await update.message.reply_text("Напоминания выключены")
+    else:
+        status = "включены" if reminders.enabled(user_id) else "выключены"
+        await update.message.reply_text(f"Напоминания {status}.\nИспользование: /reminders on|off")
+
+
+@timed_handler
+@with_budget(WEATHER_BUDGET)
 async def weather_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
         await update.message.reply_text("Использование: /weather <город>")
@@ -423,7 +546,7 @@ async def weather_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     city = ' '.join(context.args)
 
     # Получаем температуру
-    temp = get_temperature(city)
+    temp = await get_temperature(city)
 
     if temp is not None:
         response = f"Температура в {city}: {temp}°C"
@@ -438,6 +561,31 @@ async def weather_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(response)
 
 
+@timed_handler
+@with_budget(FOOD_BUDGET)
+async def inline_food_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.inline_query.query
+    results = await inline_search(update.effective_user.id, query)
+    if results is None:
+        # Пользователь уже набрал запрос дальше, ответим на новый
+        return
+
+    articles = []
+    for i, product in enumerate(results):
+        calories = product['calories']
+        description = f"{float(calories):.0f} ккал/100г" if calories else "калорийность неизвестна"
+        articles.append(InlineQueryResultArticle(
+            id=str(product['id'] or i),
+            title=product['name'],
+            description=description,
+            input_message_content=InputTextMessageContent(f"{product['name']}: {description}")
+        ))
+
+    await update.inline_query.answer(articles, cache_time=300)
+
+
+@timed_handler
+@with_budget(FOOD_BUDGET)
 async def food_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
         await update.message.reply_text("Использование: /food_search <название продукта>")
@@ -445,8 +593,7 @@ async def food_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     food_name = ' '.join(context.args)
 
-    from utils.food_api import search_food_products
-    results = search_food_products(food_name, limit=5)
+    results = await search_food_products(food_name, limit=5)
 
     if not results:
         await update.message.reply_text(f"Продукты '{food_name}' не найдены в базе OpenFoodFacts")
@@ -456,7 +603,10 @@ async def food_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
     for i, product in enumerate(results, 1):
         calories = product['calories'] or "неизвестно"
         response += f"{i}. {product['name']}\n"
-        response += f"   Калории: {calories} ккал/100г\n\n"
+        response += f"   Калории: {calories} ккал/100г\n"
+        if product['id']:
+            response += f"   Штрихкод: {product['id']}\n"
+        response += "\n"
 
     response += "Используйте: /log_food <номер> <граммы>"
 
@@ -465,51 +615,102 @@ async def food_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(response)
 
 
+@timed_handler
 async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать данные профиля пользователя"""
     user_id = update.effective_user.id
 
-    if user_id not in users:
+    user = await store.get(user_id)
+    if user is None:
         await update.message.reply_text("Профиль не найден. Сначала настройте профиль: /set_profile")
         return
 
-    user = users[user_id]
-
     profile_text = f"""
  ВАШ ПРОФИЛЬ
 
 Основные данные:
- Вес: {user['weight']} кг
- Рост: {user['height']} см
- Возраст: {user['age']} лет
- Активность: {user['activity']} мин/день
- Город: {user['city']}
+ Вес: {user.weight} кг
+ Рост: {user.height} см
+ Возраст: {user.age} лет
+ Активность: {user.activity} мин/день
+ Город: {user.city}
 
 Дневные нормы:
- Вода: {user['water_goal']} мл/день
- Калории: {user['calorie_goal']:.0f} ккал/день
+ Вода: {user.day_water_goal} мл/день
+ Калории: {user.calorie_goal:.0f} ккал/день
 
 Сегодняшний прогресс:
- Выпито воды: {user['logged_water']} мл
- Потреблено калорий: {user['logged_calories']:.1f} ккал
- Сожжено калорий: {user['burned_calories']:.1f} ккал
+ Выпито воды: {user.logged_water} мл
+ Потреблено калорий: {user.logged_calories:.1f} ккал
+ Сожжено калорий: {user.burned_calories:.1f} ккал
 
 Осталось сегодня:
- Воды: {max(0, user['water_goal'] - user['logged_water'])} мл
- Калорий: {user['calorie_goal'] - user['logged_calories'] + user['burned_calories']:.0f} ккал до цели
+ Воды: {max(0, user.day_water_goal - user.logged_water)} мл
+ Калорий: {user.calorie_goal - user.logged_calories + user.burned_calories:.0f} ккал до цели
 """
 
     await update.message.reply_text(profile_text)
 
 
-async def log_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.message and update.message.text:
-        logger.info(f"Получено сообщение: {update.message.text}")
-    return True
+async def prewarm():
+    """Готовит тяжёлые подсистемы в фоне, пока бот уже принимает обновления"""
+    def load():
+        import aiohttp  # noqa: F401
+        load_index()
+        get_reference()
 
-
-def main():
-    application = Application.builder().token(TOKEN).build()
+    try:
+        await asyncio.to_thread(load)
+        get_session()
+    except Exception as e:
+        # Не страшно: всё это загрузится при первом обращении
+        logger.error(f"Ошибка прогрева: {e}")
+
+
+async def post_init(application: Application):
+    await store.start()
+    await weather_refresher.start()
+    await reminders.start(application.bot)
+    port = application.bot_data.get('metrics_port', metrics.METRICS_PORT)
+    application.bot_data['metrics_runner'] = await metrics.start_metrics_server(port)
+    application.bot_data['prewarm'] = asyncio.create_task(prewarm())
+
+
+async def post_shutdown(application: Application):
+    task = application.bot_data.pop('prewarm', None)
+    if task is not None:
+        task.cancel()
+    await weather_refresher.close()
+    await reminders.close()
+    await store.close()
+    # Недождавшиеся запросы к API, в том числе фоновые обновления кэша
+    await cancel_flights()
+    await close_barcodes()
+    await close_session()
+    runner = application.bot_data.pop('metrics_runner', None)
+    if runner is not None:
+        await runner.cleanup()
+    metrics.dump()
+
+
+def build_application(updater=True):
+    builder = (
+        Application.builder()
+        .token(TOKEN)
+        .base_url(TELEGRAM_API_URL)
+        .request(InstrumentedRequest(connection_pool_size=256))
+        # Незаконченные диалоги и user_data переживают перезапуск
+        .persistence(SQLitePersistence())
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if not updater:
+        builder.updater(None)
+    if BOT_CONCURRENCY > 1:
+        # Разные пользователи параллельно, каждый пользователь — по порядку
+        builder.application_class(
+            UserOrderedApplication, kwargs={'max_concurrency': BOT_CONCURRENCY})
+    application = builder.build()
 
     conv_profile = ConversationHandler(
         entry_points=[CommandHandler('set_profile', set_profile)],
@@ -520,7 +721,9 @@ def main():
             ACTIVITY: [MessageHandler(filters.TEXT & ~filters.COMMAND, activity_received)],
             CITY: [MessageHandler(filters.TEXT & ~filters.COMMAND, city_received)],
         },
-        fallbacks=[CommandHandler('cancel', cancel)]
+        fallbacks=[CommandHandler('cancel', cancel)],
+        name='profile',
+        persistent=True
     )
 
     conv_food = ConversationHandler(
@@ -531,24 +734,184 @@ def main():
                                food_weight_received)
             ],
         },
-        fallbacks=[CommandHandler('cancel', cancel)]
+        fallbacks=[CommandHandler('cancel', cancel)],
+        name='food',
+        persistent=True
     )
 
-    application.add_handler(MessageHandler(
-        filters.TEXT, log_message), group=-1)
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(conv_profile)
     application.add_handler(conv_food)
     application.add_handler(CommandHandler("log_water", log_water))
+    application.add_handler(CommandHandler("log_code", log_code))
     application.add_handler(CommandHandler("log_workout", log_workout))
     application.add_handler(CommandHandler("check_progress", check_progress))
+    application.add_handler(CommandHandler("stats", stats_command))
     application.add_handler(CommandHandler("weather", weather_command))
     application.add_handler(CommandHandler("food_search", food_search))
+    application.add_handler(CommandHandler("reminders", reminders_command))
+    application.add_handler(InlineQueryHandler(inline_food_search))
     application.add_handler(CommandHandler("profile", profile_command))
 
-    logger.info("Бот запущен...")
-    application.run_polling()
+    return application
+
+
+async def run_webhook(application: Application):
+    """Приём обновлений через встроенный HTTP-сервер вместо long polling.
+
+    Рассчитан на один процесс; несколько — через run_sharded с SHARDED_INPUT=webhook.
+    """
+    from utils.webhook import WebhookServer, WEBHOOK_URL, WEBHOOK_SECRET, wait_for_stop_signal
+
+    async def on_update(data):
+        await application.update_queue.put(Update.de_json(data, application.bot))
+
+    server = WebhookServer(on_update)
+    # Метрики отдаёт сам сервер вебхука
+    application.bot_data['metrics_port'] = 0
+
+    await application.initialize()
+    await post_init(application)
+    if WEBHOOK_URL:
+        await application.bot.set_webhook(
+            WEBHOOK_URL, secret_token=WEBHOOK_SECRET, allowed_updates=Update.ALL_TYPES)
+    await application.start()
+    await server.start()
+
+    logger.info("Бот запущен (вебхук)...")
+    try:
+        await wait_for_stop_signal()
+    finally:
+        # Сначала перестаём принимать обновления, затем дорабатываем очередь
+        await server.stop()
+        await application.stop()
+        await application.shutdown()
+        await post_shutdown(application)
+
+
+async def run_worker(index, queue):
+    """Процесс-обработчик своего шарда пользователей; обновления приходят от фронта"""
+    from utils.sharding import ShardMap
+
+    application = build_application(updater=False)
+    # Нормы воды пересчитывает и напоминает только пользователям своего шарда
+    shard_map = ShardMap.load()
+    weather_refresher.owns = lambda user_id: shard_map.worker_for(user_id) == index
+    reminders.owns = weather_refresher.owns
+    # Лимит рассылок общий для бота, а очередь у каждого обработчика своя
+    outbound.share(shard_map.workers)
+    # У каждого обработчика свой порт метрик: METRICS_PORT + 1 + номер
+    application.bot_data['metrics_port'] = metrics.METRICS_PORT and metrics.METRICS_PORT + 1 + index
+    loop = asyncio.get_running_loop()
+
+    await application.initialize()
+    await post_init(application)
+    await application.start()
+    logger.info(f"Обработчик {index} запущен")
+
+    while True:
+        data = await loop.run_in_executor(None, queue.get)
+        if data is None:
+            break
+        await application.update_queue.put(Update.de_json(data, application.bot))
+
+    await application.stop()
+    await application.shutdown()
+    await post_shutdown(application)
+
+
+def worker_main(index, queue):
+    # Остановкой обработчиков управляет фронт, Ctrl+C приходит всей группе процессов
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(run_worker(index, queue))
+
+
+async def run_front(shard_map, queues):
+    """Принимает обновления и раскладывает их по процессам по хешу user_id"""
+    from telegram import Bot
+    from utils.dispatch import ordering_key
+    from utils.webhook import WebhookServer, WEBHOOK_URL, WEBHOOK_SECRET, wait_for_stop_signal
+
+    bot = Bot(TOKEN, base_url=TELEGRAM_API_URL)
+
+    def route(data):
+        key = ordering_key(Update.de_json(data, bot))
+        queues[shard_map.worker_for(key or 0)].put(data)
+
+    async def on_update(data):
+        route(data)
+
+    async def poll():
+        offset = None
+        while True:
+            try:
+                updates = await bot.get_updates(
+                    offset=offset, timeout=30, allowed_updates=Update.ALL_TYPES)
+            except TelegramError as e:
+                logger.error(f"Ошибка получения обновлений: {e}")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                route(update.to_dict())
+                offset = update.update_id + 1
+
+    async with bot:
+        if SHARDED_INPUT == 'webhook':
+            server = WebhookServer(on_update)
+            if WEBHOOK_URL:
+                await bot.set_webhook(
+                    WEBHOOK_URL, secret_token=WEBHOOK_SECRET, allowed_updates=Update.ALL_TYPES)
+            await server.start()
+            try:
+                await wait_for_stop_signal()
+            finally:
+                await server.stop()
+        else:
+            await bot.delete_webhook()
+            poller = asyncio.create_task(poll())
+            try:
+                await wait_for_stop_signal()
+            finally:
+                poller.cancel()
+
+
+def run_sharded(workers):
+    from utils.sharding import ShardMap
+
+    shard_map = ShardMap.load_or_create(workers)
+    mp = multiprocessing.get_context('spawn')
+    queues = [mp.Queue() for _ in range(workers)]
+    processes = [
+        mp.Process(target=worker_main, args=(i, queue), name=f"bot-worker-{i}")
+        for i, queue in enumerate(queues)
+    ]
+    for process in processes:
+        process.start()
+
+    logger.info(f"Бот запущен ({workers} обработчиков)...")
+    try:
+        asyncio.run(run_front(shard_map, queues))
+    finally:
+        # Обработчики дорабатывают свои очереди и выходят
+        for queue in queues:
+            queue.put(None)
+        for process in processes:
+            process.join()
+
+
+def main():
+    if BOT_MODE == 'sharded':
+        run_sharded(BOT_WORKERS)
+        return
+
+    application = build_application()
+
+    if BOT_MODE == 'webhook':
+        asyncio.run(run_webhook(application))
+    else:
+        logger.info("Бот запущен...")
+        application.run_polling()
 
 
 if __name__ == "__main__":
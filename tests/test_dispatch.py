@@ -0,0 +1,101 @@
+"""UserOrderedApplication: порядок обновлений пользователя и остановка без потерь"""
+import asyncio
+import json
+import random
+
+from telegram import Update
+from telegram.ext import Application, CommandHandler
+from telegram.request import BaseRequest
+
+from utils.dispatch import UserOrderedApplication
+
+USERS = 20
+UPDATES_PER_USER = 25
+
+
+class FakeRequest(BaseRequest):
+    """Bot API без сети: отвечает только на getMe"""
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        result = {'id': 1, 'is_bot': True, 'first_name': 'test', 'username': 'test_bot'}
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+def make_update(bot, update_id, user_id, text):
+    user = {'id': user_id, 'is_bot': False, 'first_name': 'u'}
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': 0, 'text': text, 'from': user,
+            'chat': {'id': user_id, 'type': 'private'},
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': text.index(' ')}],
+        },
+    }, bot)
+
+
+def build(totals, order):
+    application = (
+        Application.builder()
+        .token('1:test')
+        .request(FakeRequest())
+        .get_updates_request(FakeRequest())
+        .updater(None)
+        .application_class(UserOrderedApplication, kwargs={'max_concurrency': 8})
+        .build()
+    )
+
+    async def log_water(update, context):
+        # Чтение и запись суммы разделены await: параллельная обработка
+        # обновлений одного пользователя потеряла бы прибавки
+        user_id = update.effective_user.id
+        total = totals.get(user_id, 0)
+        await asyncio.sleep(random.random() * 0.002)
+        totals[user_id] = total + int(context.args[0])
+        order.setdefault(user_id, []).append(int(context.args[1]))
+
+    application.add_handler(CommandHandler('log_water', log_water))
+    return application
+
+
+async def run(stop_early):
+    totals, order = {}, {}
+    application = build(totals, order)
+    await application.initialize()
+    await application.start()
+
+    # Обновления разных пользователей вперемешку
+    update_id = 0
+    for seq in range(UPDATES_PER_USER):
+        for user_id in range(1, USERS + 1):
+            update_id += 1
+            await application.update_queue.put(
+                make_update(application.bot, update_id, user_id, f"/log_water {user_id} {seq}"))
+
+    if not stop_early:
+        while sum(map(len, order.values())) < USERS * UPDATES_PER_USER:
+            await asyncio.sleep(0.01)
+    await application.stop()
+    await application.shutdown()
+    return totals, order
+
+
+def check(totals, order):
+    for user_id in range(1, USERS + 1):
+        assert order[user_id] == list(range(UPDATES_PER_USER))
+        assert totals[user_id] == user_id * UPDATES_PER_USER
+
+
+def test_no_lost_increments_under_concurrent_load():
+    check(*asyncio.run(run(stop_early=False)))
+
+
+def test_stop_processes_queued_updates():
+    # stop() сразу после постановки: всё, что было в очереди, обработано до возврата
+    check(*asyncio.run(run(stop_early=True)))
@@ -0,0 +1,86 @@
+"""SQLitePersistence: в базу пишутся только изменившиеся user_data"""
+import asyncio
+
+from utils.persistence import SQLitePersistence
+
+
+class CountingPersistence(SQLitePersistence):
+    def __init__(self, path, cache_size=100):
+        super().__init__(path, cache_size=cache_size)
+        self.writes = []
+
+    def _write(self, users, conversations):
+        self.writes.append(dict(users))
+        super()._write(users, conversations)
+
+
+async def settle(persistence):
+    while persistence._write_task is not None:
+        await asyncio.sleep(0)
+
+
+async def scenario(path):
+    persistence = CountingPersistence(path)
+    user_data = {}
+    await persistence.refresh_user_data(1, user_data)
+    # Пустые данные пользователя без записи в базе: удалять нечего
+    await persistence.update_user_data(1, user_data)
+    await settle(persistence)
+    assert persistence.writes == []
+
+    user_data['goal'] = 2000
+    await persistence.update_user_data(1, user_data)
+    await settle(persistence)
+    # Повторная передача тех же данных базу не трогает
+    await persistence.update_user_data(1, user_data)
+    await settle(persistence)
+    assert persistence.writes == [{1: '{"goal": 2000}'}]
+
+    user_data.clear()
+    await persistence.update_user_data(1, user_data)
+    await settle(persistence)
+    await persistence.update_user_data(1, user_data)
+    await settle(persistence)
+    assert persistence.writes[1:] == [{1: None}]
+    await persistence.flush()
+
+    # После перезапуска сохранённое значение известно и не переписывается
+    persistence = CountingPersistence(path)
+    await persistence.update_user_data(2, {'goal': 1500})
+    await persistence.flush()
+    persistence = CountingPersistence(path)
+    user_data = {}
+    await persistence.refresh_user_data(2, user_data)
+    assert user_data == {'goal': 1500}
+    await persistence.update_user_data(2, user_data)
+    await persistence.flush()
+    assert persistence.writes == []
+
+
+def test_unchanged_user_data_is_not_written(tmp_path):
+    asyncio.run(scenario(str(tmp_path / 'state.db')))
+
+
+async def bounded(path):
+    persistence = CountingPersistence(path, cache_size=2)
+    for user_id in range(1, 6):
+        await persistence.update_user_data(user_id, {'goal': user_id})
+    await settle(persistence)
+    assert len(persistence._written) == 2
+
+    # Вытесненный пользователь перечитывается, записанное не теряется
+    user_data = {}
+    await persistence.refresh_user_data(1, user_data)
+    assert user_data == {'goal': 1}
+
+    await persistence.drop_user_data(1)
+    await settle(persistence)
+    assert persistence._written.peek(1) is None and 1 not in persistence._written._data
+    user_data = {}
+    await persistence.refresh_user_data(1, user_data)
+    assert user_data == {}
+    await persistence.flush()
+
+
+def test_known_users_are_bounded_and_dropped(tmp_path):
+    asyncio.run(bounded(str(tmp_path / 'state.db')))
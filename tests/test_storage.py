@@ -0,0 +1,65 @@
+"""UserStore: ограниченный набор пользователей в памяти без потери несохранённых сумм"""
+import asyncio
+
+from utils.storage import UserStore, WATER
+
+PROFILE = {'weight': 70, 'height': 175, 'age': 30, 'activity': 30, 'city': 'Москва',
+           'water_goal': 2100, 'calorie_goal': 2200, 'tz_offset': 10800}
+
+
+async def scenario(path):
+    store = UserStore(path, cache_size=3)
+    for user_id in range(1, 11):
+        await store.save_profile(user_id, PROFILE)
+    assert await store.get(99) is None
+
+    for user_id in range(1, 11):
+        await store.record(user_id, WATER, user_id)
+    # Несохранённые суммы держат пользователей в памяти
+    store._evict()
+    assert len(store._users) == 10
+
+    store.flush()
+    store._evict()
+    assert len(store._users) == 3
+    assert list(store._users) == [8, 9, 10]
+
+    # Вытесненный пользователь читается из базы вместе с сегодняшними суммами
+    user = await store.get(1)
+    assert user.logged_water == 1
+    await store.record(1, WATER, 5)
+    users = await store.get_many([1, 2, 99])
+    assert sorted(users) == [1, 2]
+    assert users[1].logged_water == 6
+    await store.close()
+
+    store = UserStore(path, cache_size=3)
+    assert (await store.get(1)).logged_water == 6
+    await store.close()
+
+
+def test_evicted_users_are_reloaded(tmp_path):
+    asyncio.run(scenario(str(tmp_path / 'users.db')))
+
+
+async def two_writers(path):
+    first, second = UserStore(path), UserStore(path)
+    await first.save_profile(1, PROFILE)
+    await first.record(1, WATER, 500)
+    await second.record(1, WATER, 300)
+    first.flush()
+    second.flush()
+    # Профиль из второго процесса не затирает сегодняшние суммы
+    await second.save_profile(1, {**PROFILE, 'weight': 80})
+    await first.close()
+    await second.close()
+
+    store = UserStore(path)
+    user = await store.get(1)
+    assert user.logged_water == 800
+    assert user.weight == 80
+    await store.close()
+
+
+def test_two_writers_keep_both_increments(tmp_path):
+    asyncio.run(two_writers(str(tmp_path / 'users.db')))
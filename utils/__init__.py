@@ -1,11 +1,19 @@
-from .calculations import calculate_water_norm, calculate_calories_norm, get_temperature
-from .food_api import get_food_info_openfoodfacts, get_average_calories, search_food_products
+from .calculations import calculate_water_norm, calculate_calories_norm, get_temperature, get_weather
+from .food_api import (
+    get_food_info_openfoodfacts, get_average_calories, get_reference_calories,
+    search_food_products, food_cache_stats, resolve_food, get_food_by_code
+)
 
 __all__ = [
     'calculate_water_norm',
     'calculate_calories_norm',
     'get_temperature',
+    'get_weather',
     'get_food_info_openfoodfacts',
     'get_average_calories',
-    'search_food_products'
+    'get_reference_calories',
+    'search_food_products',
+    'food_cache_stats',
+    'resolve_food',
+    'get_food_by_code'
 ]
@@ -0,0 +1,196 @@
+"""Индекс штрихкод → (название, ккал/100 г) для команды /log_code.
+
+Коды попадают в индекс из результатов уже сделанных запросов к OpenFoodFacts
+и локальному индексу, а также из выгрузки OpenFoodFacts:
+    python -m utils.barcodes en.openfoodfacts.org.products.csv.gz
+
+Индекс хранится в SQLite, часто запрашиваемые коды — в памяти. Поиск по коду —
+одно обращение к словарю или по первичному ключу в отдельном потоке через
+своё соединение, не ждущее фоновой записи; OpenFoodFacts по коду
+запрашивается только если кода нет в индексе.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+
+from .cache import TTLCache
+from .metrics import register_cache
+
+logger = logging.getLogger(__name__)
+
+BARCODES_DB_PATH = os.getenv("BARCODES_DB_PATH", "data/barcodes.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS barcodes (
+    code TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    kcal REAL NOT NULL
+) WITHOUT ROWID
+"""
+_SELECT_SQL = "SELECT name, kcal FROM barcodes WHERE code = ?"
+_UPSERT_SQL = "INSERT OR REPLACE INTO barcodes (code, name, kcal) VALUES (?, ?, ?)"
+
+
+def valid_code(code):
+    """Штрихкоды EAN/UPC — от 8 до 14 цифр"""
+    return code.isdigit() and 8 <= len(code) <= 14
+
+
+class BarcodeIndex:
+    """Штрихкоды в SQLite с LRU-кэшем в памяти; новые коды пишутся в фоне пачками"""
+
+    def __init__(self, path=BARCODES_DB_PATH, cache_size=50000):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._read_conn = None
+        self._read_lock = threading.Lock()
+        self.cache = TTLCache(maxsize=cache_size, ttl=float('inf'))
+        self._pending = {}
+        self._write_task = None
+
+    def _connection(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _read(self, code):
+        with self._read_lock:
+            if self._read_conn is None:
+                # Схему создаёт соединение для записи
+                with self._lock:
+                    self._connection()
+                self._read_conn = sqlite3.connect(self.path, check_same_thread=False)
+                self._read_conn.execute("PRAGMA query_only = ON")
+            return self._read_conn.execute(_SELECT_SQL, (code,)).fetchone()
+
+    async def get(self, code):
+        """(название, ккал/100 г) или None, если кода нет в индексе"""
+        found = self.cache.get(code)
+        if found is None:
+            found = await asyncio.to_thread(self._read, code)
+            if found is not None:
+                found = tuple(found)
+                # Пока шло чтение, remember мог положить более свежее значение
+                found = self.cache.peek(code) or found
+                self.cache.set(code, found)
+        return found
+
+    def remember(self, code, name, kcal):
+        """Добавляет продукт с известной калорийностью; вызывается в цикле событий"""
+        if not code or not name or not valid_code(str(code)):
+            return
+        try:
+            kcal = round(float(kcal), 1)
+        except (TypeError, ValueError):
+            return
+        if kcal <= 0:
+            return
+        code = str(code)
+        product = (name, kcal)
+        if self.cache.peek(code) == product:
+            return
+        self.cache.set(code, product)
+        self._pending[code] = product
+        if self._write_task is None:
+            self._write_task = asyncio.create_task(self._write_pending())
+
+    def _write(self, products):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(_UPSERT_SQL, (
+                    (code, name, kcal) for code, (name, kcal) in products))
+
+    async def _write_pending(self):
+        # Коды из одного ответа API пишутся одной транзакцией
+        await asyncio.sleep(0)
+        try:
+            while self._pending:
+                products, self._pending = self._pending, {}
+                try:
+                    await asyncio.to_thread(self._write, products.items())
+                except sqlite3.Error as e:
+                    logger.error(f"Ошибка записи штрихкодов: {e}")
+                    return
+        finally:
+            self._write_task = None
+
+    def load_dump(self, path, batch=10000):
+        """Заполняет индекс из выгрузки OpenFoodFacts; возвращает число продуктов"""
+        from .food_index import iter_dump
+
+        count = 0
+        products = []
+        for code, name, brand, kcal in iter_dump(path):
+            name = ' '.join(name.split())
+            if not name or kcal is None or not valid_code(code):
+                continue
+            brand = ' '.join(brand.split())
+            products.append((code, (f"{brand} - {name}" if brand else name, round(kcal, 1))))
+            if len(products) >= batch:
+                self._write(products)
+                count += len(products)
+                products = []
+        self._write(products)
+        return count + len(products)
+
+    async def close(self, *args):
+        if self._write_task is not None:
+            await self._write_task
+        if self._pending:
+            products, self._pending = self._pending, {}
+            self._write(products.items())
+        with self._read_lock:
+            if self._read_conn is not None:
+                self._read_conn.close()
+                self._read_conn = None
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def __len__(self):
+        return len(self.cache)
+
+
+_barcodes = None
+
+
+def get_barcodes():
+    """Индекс штрихкодов; база открывается при первом обращении"""
+    global _barcodes
+    if _barcodes is None:
+        _barcodes = BarcodeIndex(cache_size=int(os.getenv("BARCODES_CACHE_SIZE", 50000)))
+        register_cache('barcodes', _barcodes.cache)
+    return _barcodes
+
+
+async def close_barcodes(*args):
+    """Дописывает новые коды и закрывает базу, если индекс открывался"""
+    if _barcodes is not None:
+        await _barcodes.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Заполнение индекса штрихкодов из выгрузки OpenFoodFacts")
+    parser.add_argument('source', help="CSV или JSONL выгрузка (можно .gz)")
+    parser.add_argument('-o', '--output', default=BARCODES_DB_PATH)
+    args = parser.parse_args()
+
+    index = BarcodeIndex(args.output)
+    count = index.load_dump(args.source)
+    print(f"Готово: {count} штрихкодов -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import os
+import time
+from collections import deque
+
+from .metrics import UPSTREAM_CIRCUIT_STATE, upstream_error
+
+# Доля ошибок за окно, после которой внешний API перестаём вызывать
+BREAKER_FAILURE_RATIO = float(os.getenv("BREAKER_FAILURE_RATIO", 0.5))
+# Меньше стольких вызовов за окно — слишком мало, чтобы судить
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", 10))
+BREAKER_WINDOW = float(os.getenv("BREAKER_WINDOW", 30))
+# Сколько не вызывать API после срабатывания, прежде чем пробовать снова, сек
+BREAKER_OPEN_TIME = float(os.getenv("BREAKER_OPEN_TIME", 30))
+
+CLOSED, OPEN, HALF_OPEN = range(3)
+
+
+class CircuitBreaker:
+    """Размыкатель цепи для одного внешнего API.
+
+    Пока доля ошибок за последние window секунд ниже failure_ratio, вызовы
+    проходят. Когда она выше, цепь размыкается: open_time секунд вызовы сразу
+    отклоняются, и обработчики без ожидания берут запасной вариант. Затем
+    пропускается один пробный вызов; если он успешен, цепь замыкается.
+    """
+
+    def __init__(self, name, failure_ratio=BREAKER_FAILURE_RATIO, min_calls=BREAKER_MIN_CALLS,
+                 window=BREAKER_WINDOW, open_time=BREAKER_OPEN_TIME):
+        self.name = name
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.window = window
+        self.open_time = open_time
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._calls = deque()
+        self._failures = 0
+        self._state_gauge = UPSTREAM_CIRCUIT_STATE.labels(name)
+
+    def _set_state(self, state):
+        self.state = state
+        self._state_gauge.set(state)
+
+    def allow(self):
+        """Можно ли сейчас вызывать API; отказ учитывается как ошибка circuit_open"""
+        if self.state == OPEN and time.monotonic() - self._opened_at >= self.open_time:
+            self._set_state(HALF_OPEN)
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        upstream_error(self.name, 'circuit_open')
+        return False
+
+    def success(self):
+        if self.state == HALF_OPEN:
+            self._probing = False
+            self._calls.clear()
+            self._failures = 0
+            self._set_state(CLOSED)
+            return
+        self._add(True)
+
+    def failure(self):
+        if self.state == HALF_OPEN:
+            self._probing = False
+            self._open()
+            return
+        self._add(False)
+        calls = len(self._calls)
+        if calls >= self.min_calls and self._failures / calls >= self.failure_ratio:
+            self._open()
+
+    def _add(self, ok):
+        now = time.monotonic()
+        self._calls.append((now, ok))
+        if not ok:
+            self._failures += 1
+        while self._calls and now - self._calls[0][0] > self.window:
+            if not self._calls.popleft()[1]:
+                self._failures -= 1
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        self._calls.clear()
+        self._failures = 0
+        self._set_state(OPEN)
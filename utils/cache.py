@@ -0,0 +1,78 @@
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """LRU-кэш ограниченного размера с временем жизни записей.
+
+    Истёкшая запись ещё stale_ttl секунд доступна через get_stale(), чтобы
+    отвечать устаревшим значением, пока свежее запрашивается в фоне.
+    """
+
+    def __init__(self, maxsize=1024, ttl=600, stale_ttl=0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+
+        value, expires_at = item
+        now = time.monotonic()
+        if expires_at < now:
+            if expires_at + self.stale_ttl < now:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key, default=None):
+        """Свежее значение без учёта в статистике и без обновления порядка LRU"""
+        item = self._data.get(key)
+        if item is None or item[1] < time.monotonic():
+            return default
+        return item[0]
+
+    def get_stale(self, key, default=None):
+        """Значение, даже если оно истекло не больше stale_ttl секунд назад"""
+        item = self._data.get(key)
+        if item is None or item[1] + self.stale_ttl < time.monotonic():
+            return default
+        return item[0]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+
+        # Вытесняем самые давно использованные записи
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, None)
+        return default if item is None else item[0]
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0
+        }
+
+    def __len__(self):
+        return len(self._data)
@@ -1,15 +1,44 @@
-import requests
+import asyncio
 import os
 
 from dotenv import load_dotenv
+
+from .breaker import CircuitBreaker
+from .cache import TTLCache
+from .deadline import remaining
+from .http import get_session
+from .metrics import CACHE_STALE, register_cache, track_upstream, upstream_error
+from .singleflight import SingleFlight
+
 load_dotenv()
 
+OPENWEATHER_URL = os.getenv(
+    "OPENWEATHER_URL", "http://api.openweathermap.org/data/2.5/weather")
+WEATHER_TIMEOUT = float(os.getenv("WEATHER_TIMEOUT", 5))
+
+# Погода по городу: один запрос к API на город за время жизни записи;
+# истёкшая погода ещё 6 часов отдаётся, пока в фоне запрашивается свежая
+_weather_cache = TTLCache(
+    maxsize=int(os.getenv("WEATHER_CACHE_SIZE", 5000)),
+    ttl=int(os.getenv("WEATHER_CACHE_TTL", 1800)),
+    stale_ttl=int(os.getenv("WEATHER_CACHE_STALE_TTL", 6 * 3600))
+)
+register_cache('weather', _weather_cache)
+# Одновременные запросы погоды одного города идут к API одним запросом
+_flights = SingleFlight('openweathermap')
+_breaker = CircuitBreaker('openweathermap')
+
+
+async def calculate_water_norm(weight, activity_minutes, city):
+    temp = await get_temperature(city)
+    return water_norm(weight, activity_minutes, temp)
 
-def calculate_water_norm(weight, activity_minutes, city):
+
+def water_norm(weight, activity_minutes, temp):
+    """Норма воды по уже известной температуре (None — температура неизвестна)"""
     base = weight * 30
     activity_water = (activity_minutes // 30) * 500
 
-    temp = get_temperature(city)
     weather_water = 0
     if temp and temp > 25:
         weather_water = 500
@@ -27,19 +56,118 @@ def calculate_calories_norm(weight, height, age, activity_minutes):
     return daily_calories + activity_calories
 
 
-def get_temperature(city):
+def water_norm_batch(weight, activity_minutes, temp):
+    """water_norm для массивов; неизвестная температура — NaN.
+
+    Результат (int64) совпадает с water_norm поэлементно: те же операции
+    в том же порядке над float64 и отбрасывание дробной части как у int().
+    """
+    # numpy нужен только пакетным пересчётам, поэтому не грузится при старте бота
+    import numpy as np
+
+    weight = np.asarray(weight, dtype=np.float64)
+    activity_minutes = np.asarray(activity_minutes, dtype=np.float64)
+    temp = np.asarray(temp, dtype=np.float64)
+
+    base = weight * 30
+    activity_water = np.floor_divide(activity_minutes, 30) * 500
+    # NaN > 25 ложно, как и проверка `temp and temp > 25` для None
+    weather_water = np.where(temp > 25, 500, 0)
+
+    total_water = base + activity_water + weather_water
+    return np.trunc(total_water).astype(np.int64)
+
+
+def calories_norm_batch(weight, height, age, activity_minutes):
+    """calculate_calories_norm для массивов, поэлементно равен скалярной версии"""
+    import numpy as np
+
+    weight = np.asarray(weight, dtype=np.float64)
+    height = np.asarray(height, dtype=np.float64)
+    age = np.asarray(age, dtype=np.float64)
+    activity_minutes = np.asarray(activity_minutes, dtype=np.float64)
+
+    bmr = 10 * weight + 6.25 * height - 5 * age
+    activity_factor = 1.2 + (activity_minutes / 60) * 0.1
+    daily_calories = bmr * activity_factor
+    activity_calories = activity_minutes * 7
+
+    return daily_calories + activity_calories
+
+
+async def get_temperature(city):
+    weather = await get_weather(city)
+    return weather['temp'] if weather else None
+
+
+def city_key(city):
+    return ' '.join(city.lower().split())
+
+
+async def get_weather(city, refresh=False):
+    """Температура и смещение часового пояса города от UTC (сек).
+
+    refresh=True запрашивает API в обход кэша и обновляет его. Одновременные
+    запросы одного города ждут общий ответ API. Истёкшая погода из кэша
+    отдаётся сразу и обновляется в фоне; ожидание API ограничено бюджетом
+    обработчика.
+    """
     api_key = os.getenv("OPENWEATHER_API_KEY")
     if not api_key:
         return None
 
+    key = city_key(city)
+
+    def fetch():
+        return _fetch_weather(city, key, api_key)
+
+    if not refresh:
+        weather = _weather_cache.get(key)
+        if weather is not None:
+            return weather
+        weather = _weather_cache.get_stale(key)
+        if weather is not None:
+            CACHE_STALE.labels('weather').inc()
+            _flights.spawn(key, fetch)
+            return weather
+
+    try:
+        return await asyncio.wait_for(_flights.do(key, fetch), timeout=remaining(WEATHER_TIMEOUT))
+    except asyncio.TimeoutError:
+        return None
+
+
+async def _fetch_weather(city, key, api_key):
+    import aiohttp
+
+    if not _breaker.allow():
+        return None
+    healthy = False
     try:
-        url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={api_key}&units=metric"
-        response = requests.get(url, timeout=5)
+        params = {'q': city, 'appid': api_key, 'units': 'metric'}
+        timeout = aiohttp.ClientTimeout(total=WEATHER_TIMEOUT)
+        with track_upstream('openweathermap'):
+            async with get_session().get(OPENWEATHER_URL, params=params, timeout=timeout) as response:
+                if response.status != 200:
+                    upstream_error('openweathermap', f"http_{response.status}")
+                    # Неизвестный город (404) не говорит о том, что API болен
+                    healthy = response.status < 500 and response.status != 429
+                    return None
+                data = await response.json(content_type=None)
+                healthy = True
 
-        if response.status_code == 200:
-            data = response.json()
-            return data['main']['temp']
-    except:
+        weather = {
+            'temp': data['main']['temp'],
+            'timezone': data.get('timezone')
+        }
+        _weather_cache.set(key, weather)
+        return weather
+    except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, ValueError):
         pass
+    finally:
+        if healthy:
+            _breaker.success()
+        else:
+            _breaker.failure()
 
     return None
@@ -0,0 +1,36 @@
+"""Бюджет времени обработчика на ожидание внешних API.
+
+Обработчик задаёт бюджет декоратором with_budget, а код запросов берёт
+таймаут через remaining(): сколько осталось от бюджета, но не больше
+собственного таймаута запроса. Бюджет хранится в contextvar и поэтому
+действует во всех вызовах внутри обработчика.
+"""
+import contextvars
+import functools
+import time
+
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+
+def remaining(timeout):
+    """Таймаут для очередного запроса: остаток бюджета, но не больше timeout"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return timeout
+    return max(0.0, min(timeout, deadline - time.monotonic()))
+
+
+def with_budget(seconds):
+    """Декоратор обработчика: все запросы внутри укладываются в seconds"""
+    def decorator(callback):
+        @functools.wraps(callback)
+        async def wrapper(*args, **kwargs):
+            token = _deadline.set(time.monotonic() + seconds)
+            try:
+                return await callback(*args, **kwargs)
+            finally:
+                _deadline.reset(token)
+
+        return wrapper
+
+    return decorator
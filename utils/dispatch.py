@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import os
+from collections import deque
+
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+# Сколько обновлений разных пользователей обрабатывается одновременно
+BOT_CONCURRENCY = int(os.getenv("BOT_CONCURRENCY", 32))
+# Сколько принятых, но ещё не обработанных обновлений держим в памяти
+BOT_MAX_PENDING = int(os.getenv("BOT_MAX_PENDING", 10000))
+
+
+def ordering_key(update):
+    """Ключ, внутри которого обновления обрабатываются строго по порядку"""
+    user = getattr(update, 'effective_user', None)
+    if user is not None:
+        return user.id
+    chat = getattr(update, 'effective_chat', None)
+    if chat is not None:
+        return chat.id
+    return None
+
+
+class UserOrderedApplication(Application):
+    """Application, который обрабатывает обновления разных пользователей параллельно.
+
+    Обновления одного пользователя выстраиваются в его очередь и обрабатываются
+    строго по одному в порядке получения, поэтому read-modify-write над его
+    данными не гоняется. Всего одновременно работает не больше max_concurrency
+    обработчиков.
+
+    Inline-запросы не меняют данных пользователя и обрабатываются вне его
+    очереди: иначе каждый следующий символ ждал бы окончания предыдущего.
+
+    stop() дожидается всех обновлений, уже разложенных по очередям.
+    """
+
+    def __init__(self, max_concurrency=BOT_CONCURRENCY, max_pending=BOT_MAX_PENDING, **kwargs):
+        super().__init__(**kwargs)
+        self.max_concurrency = max_concurrency
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._pending = asyncio.Semaphore(max_pending)
+        self._queues = {}
+        self._tasks = set()
+
+    async def process_update(self, update):
+        # Вызывается из последовательного цикла получения обновлений, поэтому
+        # порядок постановки в очереди совпадает с порядком прихода
+        await self._pending.acquire()
+
+        key = None if update.inline_query is not None else ordering_key(update)
+        if key is None:
+            self._spawn(self._process_one(update))
+            return
+
+        queue = self._queues.get(key)
+        if queue is not None:
+            queue.append(update)
+            return
+
+        self._queues[key] = deque([update])
+        self._spawn(self._drain(key))
+
+    def _spawn(self, coroutine):
+        # Не create_task: после начала stop() Application его задачи не ждёт
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def stop(self):
+        # Родительский stop() дожидается, пока цикл получения разложит по
+        # очередям всё, что уже в update_queue; затем дорабатываем очереди.
+        # Данные этих обновлений сохранит update_persistence() в shutdown()
+        await super().stop()
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _process_one(self, update):
+        try:
+            async with self._slots:
+                await super().process_update(update)
+        except Exception as e:
+            logger.error(f"Ошибка обработки обновления: {e}")
+        finally:
+            self._pending.release()
+
+    async def _drain(self, key):
+        queue = self._queues[key]
+        try:
+            while queue:
+                # Обновление остаётся в очереди, пока обрабатывается, чтобы
+                # новые обновления этого пользователя вставали за ним
+                await self._process_one(queue[0])
+                queue.popleft()
+        finally:
+            del self._queues[key]
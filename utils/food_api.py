@@ -1,88 +1,221 @@
-import re
+import asyncio
 import logging
-import requests
 import os
 
-logging.basicConfig(level=logging.INFO)
+from .barcodes import get_barcodes
+from .breaker import CircuitBreaker
+from .cache import TTLCache
+from .deadline import remaining
+from .food_index import get_index
+from .food_reference import match_food
+from .http import get_session
+from .metrics import CACHE_STALE, register_cache, track_upstream, upstream_error
+from .singleflight import SingleFlight
+from .text import normalize_text
+
 logger = logging.getLogger(__name__)
 
+OPENFOODFACTS_URL = os.getenv(
+    "OPENFOODFACTS_URL", "https://world.openfoodfacts.org/cgi/search.pl")
+# Карточка продукта по штрихкоду: <URL>/<код>.json
+OPENFOODFACTS_PRODUCT_URL = os.getenv(
+    "OPENFOODFACTS_PRODUCT_URL", "https://world.openfoodfacts.org/api/v2/product")
+OPENFOODFACTS_TIMEOUT = float(os.getenv("OPENFOODFACTS_TIMEOUT", 10))
+OPENFOODFACTS_SEARCH_TIMEOUT = float(os.getenv("OPENFOODFACTS_SEARCH_TIMEOUT", 5))
+# Не больше стольких одновременных запросов к OpenFoodFacts со всего бота
+OPENFOODFACTS_MAX_CONCURRENCY = int(os.getenv("OPENFOODFACTS_MAX_CONCURRENCY", 10))
+# Подробный лог каждого запроса к OpenFoodFacts и найденного продукта
+OFF_DEBUG = os.getenv("OFF_DEBUG", "").lower() in ("1", "true", "yes")
+if OFF_DEBUG:
+    logger.setLevel(logging.DEBUG)
+
+# Общий кэш запросов к OpenFoodFacts, включая ответы «не найдено»;
+# истёкшие записи ещё неделю отдаются, пока в фоне запрашиваются свежие
+_lookup_cache = TTLCache(
+    maxsize=int(os.getenv("FOOD_CACHE_SIZE", 10000)),
+    ttl=int(os.getenv("FOOD_CACHE_TTL", 24 * 3600)),
+    stale_ttl=int(os.getenv("FOOD_CACHE_STALE_TTL", 7 * 24 * 3600))
+)
+register_cache('openfoodfacts', _lookup_cache)
+FOOD_NEGATIVE_CACHE_TTL = int(os.getenv("FOOD_NEGATIVE_CACHE_TTL", 3600))
+# Уверенность совпадения со справочником, при которой OpenFoodFacts не нужен
+FOOD_REFERENCE_MIN_SCORE = float(os.getenv("FOOD_REFERENCE_MIN_SCORE", 0.75))
+# Уверенность, при которой справочник лучше средних 250 ккал
+FOOD_FALLBACK_MIN_SCORE = float(os.getenv("FOOD_FALLBACK_MIN_SCORE", 0.45))
+DEFAULT_CALORIES = 250
+_MISSING = object()
+
+_semaphore = None
+# Одинаковые одновременные поиски идут к API одним запросом
+_flights = SingleFlight('openfoodfacts')
+_breaker = CircuitBreaker('openfoodfacts')
+
 
-def get_food_info_openfoodfacts(food_name):
+def _get_semaphore():
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(OPENFOODFACTS_MAX_CONCURRENCY)
+    return _semaphore
+
+
+async def _request(url, params, query, missing=()):
+    """GET к OpenFoodFacts; JSON ответа, {} для статусов из missing или None при ошибке.
+
+    Пока размыкатель цепи разомкнут, сразу возвращает None.
+    """
+    if not _breaker.allow():
+        return None
+    healthy = False
     try:
-        search_url = "https://world.openfoodfacts.org/cgi/search.pl"
-        params = {
-            'search_terms': food_name,
-            'search_simple': 1,
-            'action': 'process',
-            'json': 1,
-            'page_size': 3  # Увеличим количество результатов
-        }
-
-        print(f"=== ЗАПРОС К OPENFOODFACTS API ===")
-        print(f"Продукт: {food_name}")
-        print(f"URL: {search_url}")
-        print(f"Параметры: {params}")
-
-        response = requests.get(search_url, params=params, timeout=10)
-
-        print(f"Статус ответа: {response.status_code}")
-        print(f"=== КОНЕЦ ЗАПРОСА ===")
-
-        if response.status_code != 200:
-            return None, None, None
+        async with _get_semaphore():
+            with track_upstream('openfoodfacts'):
+                async with get_session().get(url, params=params) as response:
+                    if OFF_DEBUG:
+                        logger.debug("Ответ OpenFoodFacts", extra={
+                            'query': query, 'status': response.status})
+                    if response.status in missing:
+                        healthy = True
+                        return {}
+                    if response.status != 200:
+                        upstream_error('openfoodfacts', f"http_{response.status}")
+                        # Ошибка в запросе не говорит о том, что API болен
+                        healthy = response.status < 500 and response.status != 429
+                        return None
+                    data = await response.json(content_type=None)
+                    healthy = True
+                    return data
+    finally:
+        # Таймаут и отмена тоже считаются ошибкой
+        if healthy:
+            _breaker.success()
+        else:
+            _breaker.failure()
+
+
+async def _search_openfoodfacts(food_name, page_size, timeout):
+    """Запрос к поиску OpenFoodFacts; возвращает список продуктов или None при ошибке.
+
+    Дедлайн timeout действует на весь вызов, включая ожидание свободного слота.
+    Одновременные поиски того же запроса ждут один общий запрос, каждый
+    со своим дедлайном.
+    """
+    params = {
+        'search_terms': food_name,
+        'search_simple': 1,
+        'action': 'process',
+        'json': 1,
+        'page_size': page_size
+    }
+
+    async def request():
+        data = await _request(OPENFOODFACTS_URL, params, food_name)
+        return None if data is None else data.get('products', [])
+
+    # Общий запрос живёт до самого длинного дедлайна, чтобы к нему могли
+    # присоединиться и поиск, и определение калорийности
+    key = (normalize_text(food_name), page_size)
+    shared_timeout = max(timeout, OPENFOODFACTS_TIMEOUT)
+    shared = _flights.do(key, lambda: asyncio.wait_for(request(), timeout=shared_timeout))
+    return await asyncio.wait_for(shared, timeout=timeout)
+
+
+def food_cache_stats():
+    """Статистика попаданий общего кэша поиска продуктов"""
+    return _lookup_cache.stats()
+
 
-        data = response.json()
-        products_count = len(data.get('products', []))
-        print(f"Найдено продуктов: {products_count}")
+def _cached(key, revalidate):
+    """Значение из кэша или _MISSING.
 
-        if products_count == 0:
+    Истёкшее значение отдаётся сразу, а revalidate() обновляет его в фоне.
+    """
+    value = _lookup_cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+    value = _lookup_cache.get_stale(key, _MISSING)
+    if value is not _MISSING:
+        CACHE_STALE.labels('openfoodfacts').inc()
+        _flights.spawn(('revalidate', key), revalidate)
+    return value
+
+
+async def get_food_info_openfoodfacts(food_name):
+    key = ('info', normalize_text(food_name))
+    cached = _cached(key, lambda: _fetch_food_info(food_name, key, OPENFOODFACTS_TIMEOUT))
+    if cached is not _MISSING:
+        return cached
+
+    # Сначала локальный индекс, удалённый API только если там ничего нет
+    index = get_index()
+    if index is not None:
+        found = index.lookup(food_name)
+        if found:
+            return found
+
+    return await _fetch_food_info(food_name, key, remaining(OPENFOODFACTS_TIMEOUT))
+
+
+async def _fetch_food_info(food_name, key, timeout):
+    try:
+        products = await _search_openfoodfacts(food_name, page_size=3, timeout=timeout)
+
+        if products is None:
             return None, None, None
 
-        product = data['products'][0]
+        if not products:
+            _lookup_cache.set(key, (None, None, None), ttl=FOOD_NEGATIVE_CACHE_TTL)
+            return None, None, None
+
+        product = products[0]
         product_name = product.get('product_name', food_name)
         brand = product.get('brands', '')
+        calories = _product_calories(product)
+        get_barcodes().remember(
+            product.get('code'), f"{brand} - {product_name}" if brand else product_name, calories)
 
-        calories = product.get('nutriments', {}).get('energy-kcal_100g')
-
-        if not calories:
-            energy_kj = product.get('nutriments', {}).get('energy-kj_100g')
-            if energy_kj:
-                calories = energy_kj / 4.184
-
-        print(f"Бренд: {brand}")
-        print(f"Название: {product_name}")
-        print(f"Калории: {calories} ккал/100г")
+        if OFF_DEBUG:
+            logger.debug("Продукт OpenFoodFacts", extra={
+                'query': food_name, 'found': len(products), 'brand': brand,
+                'product': product_name, 'kcal_100g': calories})
 
+        _lookup_cache.set(key, (calories, product_name, 100))
         return calories, product_name, 100
 
+    except asyncio.TimeoutError:
+        logger.warning("Таймаут OpenFoodFacts", extra={'query': food_name})
+        return None, None, None
     except Exception as e:
-        print(f"Ошибка OpenFoodFacts: {e}")
+        logger.error(f"Ошибка OpenFoodFacts: {e}", extra={'query': food_name})
         return None, None, None
 
 
-def search_food_products(food_name, limit=3):
-    """Ищет продукты через OpenFoodFacts API"""
+async def search_food_products(food_name, limit=3):
+    """Ищет продукты в локальном индексе, затем через OpenFoodFacts API"""
+    key = ('search', normalize_text(food_name), limit)
+    cached = _cached(
+        key, lambda: _fetch_search(food_name, limit, key, OPENFOODFACTS_SEARCH_TIMEOUT))
+    if cached is not _MISSING:
+        return cached
+
+    index = get_index()
+    if index is not None:
+        results = index.search(food_name, limit)
+        if results:
+            _remember_codes(results)
+            return results
+
+    return await _fetch_search(food_name, limit, key, remaining(OPENFOODFACTS_SEARCH_TIMEOUT))
+
+
+async def _fetch_search(food_name, limit, key, timeout):
     try:
-        search_url = "https://world.openfoodfacts.org/cgi/search.pl"
-        params = {
-            'search_terms': food_name,
-            'search_simple': 1,
-            'action': 'process',
-            'json': 1,
-            'page_size': limit
-        }
-
-        print(f"Поиск продуктов OpenFoodFacts: {food_name}")
-        response = requests.get(search_url, params=params, timeout=5)
-
-        if response.status_code != 200:
-            print(f"Ошибка API: {response.status_code}")
-            return []
+        products = await _search_openfoodfacts(food_name, page_size=limit, timeout=timeout)
 
-        data = response.json()
-        products = data.get('products', [])
+        if products is None:
+            return []
 
-        print(f"Найдено продуктов: {len(products)}")
+        if OFF_DEBUG:
+            logger.debug("Поиск OpenFoodFacts", extra={'query': food_name, 'found': len(products)})
 
         results = []
         for product in products[:limit]:
@@ -101,8 +234,118 @@ def search_food_products(food_name, limit=3):
                 'id': product.get('code')
             })
 
+        _remember_codes(results)
+        _lookup_cache.set(
+            key, results, ttl=None if results else FOOD_NEGATIVE_CACHE_TTL)
         return results
 
+    except asyncio.TimeoutError:
+        logger.warning("Таймаут поиска OpenFoodFacts", extra={'query': food_name})
+        return []
     except Exception as e:
-        print(f"Ошибка поиска: {e}")
+        logger.error(f"Ошибка поиска OpenFoodFacts: {e}", extra={'query': food_name})
         return []
+
+
+def _product_calories(product):
+    """ккал/100 г из карточки продукта, в том числе пересчётом из кДж"""
+    nutriments = product.get('nutriments', {})
+    calories = nutriments.get('energy-kcal_100g')
+    if not calories:
+        energy_kj = nutriments.get('energy-kj_100g')
+        if energy_kj:
+            calories = energy_kj / 4.184
+    return calories
+
+
+def _remember_codes(results):
+    """Найденные продукты с кодом пополняют индекс штрихкодов для /log_code"""
+    barcodes = get_barcodes()
+    for product in results:
+        barcodes.remember(product['id'], product['name'], product['calories'])
+
+
+async def get_food_by_code(code):
+    """(ккал/100 г, название) по штрихкоду или (None, None).
+
+    Сначала индекс штрихкодов, OpenFoodFacts — только если кода там нет.
+    """
+    found = await get_barcodes().get(code)
+    if found is not None:
+        name, calories = found
+        return calories, name
+
+    key = ('code', code)
+    cached = _lookup_cache.get(key, _MISSING)
+    if cached is not _MISSING:
+        return cached
+    return await _fetch_by_code(code, key, remaining(OPENFOODFACTS_TIMEOUT))
+
+
+async def _fetch_by_code(code, key, timeout):
+    params = {'fields': 'code,product_name,brands,nutriments'}
+
+    async def request():
+        return await _request(f"{OPENFOODFACTS_PRODUCT_URL}/{code}.json", params, code, missing=(404,))
+
+    try:
+        data = await asyncio.wait_for(
+            _flights.do(key, lambda: asyncio.wait_for(request(), timeout=OPENFOODFACTS_TIMEOUT)),
+            timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.warning("Таймаут OpenFoodFacts", extra={'code': code})
+        return None, None
+    except Exception as e:
+        logger.error(f"Ошибка OpenFoodFacts: {e}", extra={'code': code})
+        return None, None
+
+    if data is None:
+        return None, None
+
+    product = data.get('product') or {}
+    try:
+        calories = float(_product_calories(product) or 0)
+    except (TypeError, ValueError):
+        calories = 0
+    name = product.get('product_name')
+    if calories <= 0 or not name:
+        # Продукта нет или у него не указана калорийность
+        _lookup_cache.set(key, (None, None), ttl=FOOD_NEGATIVE_CACHE_TTL)
+        return None, None
+
+    brand = product.get('brands', '')
+    name = f"{brand} - {name}" if brand else name
+    get_barcodes().remember(code, name, calories)
+    return calories, name
+
+
+def get_reference_calories(food):
+    """Совпадение со справочником, достаточно уверенное, чтобы не искать в OpenFoodFacts"""
+    match = match_food(food)
+    if match is not None and match.score >= FOOD_REFERENCE_MIN_SCORE:
+        return match
+    return None
+
+
+async def resolve_food(food_name):
+    """Калорийность продукта: справочник, затем OpenFoodFacts, затем среднее значение.
+
+    Возвращает (ккал/100 г, название, источник), где источник — 'reference',
+    'openfoodfacts' или 'average'.
+    """
+    reference = get_reference_calories(food_name)
+    if reference is not None:
+        return reference.kcal, reference.name, 'reference'
+
+    calories, product_name, _ = await get_food_info_openfoodfacts(food_name)
+    if calories:
+        return calories, product_name, 'openfoodfacts'
+    return get_average_calories(food_name), food_name, 'average'
+
+
+def get_average_calories(food):
+    """Средняя калорийность продукта на 100 г по встроенному справочнику"""
+    match = match_food(food)
+    if match is not None and match.score >= FOOD_FALLBACK_MIN_SCORE:
+        return match.kcal
+    return DEFAULT_CALORIES
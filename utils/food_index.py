@@ -0,0 +1,465 @@
+"""Локальный индекс продуктов, собранный из выгрузки OpenFoodFacts.
+
+Сборка индекса:
+    python -m utils.food_index en.openfoodfacts.org.products.csv.gz -o data/food_index.bin
+
+Поддерживаются CSV-выгрузка (с табуляцией) и JSONL, в том числе сжатые gzip.
+Индекс хранит только код, название, бренд и ккал/100 г (и нормализованные
+название и бренд для поиска), списки записей по словам, и открывается через mmap.
+"""
+import argparse
+import csv
+import gzip
+import heapq
+import json
+import logging
+import math
+import mmap
+import os
+import pickle
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+
+from .text import normalize_text
+
+logger = logging.getLogger(__name__)
+
+FOOD_INDEX_PATH = os.getenv("FOOD_INDEX_PATH", "data/food_index.bin")
+
+_MAGIC = b'FIDX0002'
+_HEADER = struct.Struct('<8sIIQQQQQQ')
+_OFFSET = struct.Struct('<Q')
+_KCAL = struct.Struct('<f')
+_ID = struct.Struct('<I')
+_SEP = '\x1f'
+
+# Сколько записей просматриваем на один запрос при поиске
+MAX_CANDIDATES = 2000
+# Сколько совпадений сверх limit набираем, чтобы выбрать лучшие
+SCORE_WINDOW = 20
+# Слова с префиксом, подходящим к большему числу слов словаря, проверяются
+# по названию записи, а не пересечением списков
+MAX_MERGED_TOKENS = 64
+
+
+def _open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, encoding='utf-8', errors='replace')
+
+
+def _to_float(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 and math.isfinite(value) else None
+
+
+def _kcal(kcal, kj):
+    calories = _to_float(kcal)
+    if calories is None:
+        energy_kj = _to_float(kj)
+        if energy_kj is not None:
+            calories = energy_kj / 4.184
+    return calories
+
+
+def iter_dump(path):
+    """Потоково читает выгрузку и выдаёт (code, name, brand, kcal)"""
+    with _open_text(path) as f:
+        if '.jsonl' in path or '.json' in path:
+            for line in f:
+                try:
+                    product = json.loads(line)
+                except ValueError:
+                    continue
+                nutriments = product.get('nutriments') or {}
+                yield (
+                    str(product.get('code') or ''),
+                    product.get('product_name_ru') or product.get('product_name') or '',
+                    product.get('brands') or '',
+                    _kcal(nutriments.get('energy-kcal_100g'),
+                          nutriments.get('energy-kj_100g') or nutriments.get('energy_100g'))
+                )
+        else:
+            csv.field_size_limit(sys.maxsize)
+            for row in csv.DictReader(f, delimiter='\t', quoting=csv.QUOTE_NONE):
+                yield (
+                    row.get('code') or '',
+                    row.get('product_name') or '',
+                    row.get('brands') or '',
+                    _kcal(row.get('energy-kcal_100g'),
+                          row.get('energy-kj_100g') or row.get('energy_100g'))
+                )
+
+
+# Сколько записей или пар (слово, запись) сортируется в памяти за раз при сборке
+BUILD_CHUNK = int(os.getenv("FOOD_INDEX_BUILD_CHUNK", 500000))
+
+
+def _spill(items, tmpdir, chunks):
+    """Сортирует порцию и сохраняет её во временный файл"""
+    items.sort()
+    path = os.path.join(tmpdir, f"chunk{len(chunks)}")
+    with open(path, 'wb') as f:
+        for item in items:
+            pickle.dump(item, f, pickle.HIGHEST_PROTOCOL)
+    chunks.append(path)
+    items.clear()
+
+
+def _read_chunk(path):
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def _external_sort(items, tmpdir, prefix):
+    """Сортирует поток произвольной длины порциями по BUILD_CHUNK и слиянием"""
+    chunk_dir = tempfile.mkdtemp(prefix=prefix, dir=tmpdir)
+    chunks = []
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= BUILD_CHUNK:
+            _spill(batch, chunk_dir, chunks)
+    if batch:
+        _spill(batch, chunk_dir, chunks)
+    return heapq.merge(*(_read_chunk(path) for path in chunks))
+
+
+class _BlobWriter:
+    """Записи переменной длины: данные и таблица смещений во временных файлах"""
+
+    def __init__(self, tmpdir, name):
+        self.data = open(os.path.join(tmpdir, name + '.data'), 'w+b')
+        self.offsets = open(os.path.join(tmpdir, name + '.offsets'), 'w+b')
+        self.offset = 0
+        self.count = 0
+        self.offsets.write(_OFFSET.pack(0))
+
+    def add(self, blob, size=None):
+        self.data.write(blob)
+        self.offset += len(blob) if size is None else size
+        self.count += 1
+        self.offsets.write(_OFFSET.pack(self.offset))
+
+    def copy_to(self, out):
+        """Дописывает смещения и данные в out; возвращает позиции обоих"""
+        positions = []
+        for f in (self.offsets, self.data):
+            positions.append(out.tell())
+            f.seek(0)
+            shutil.copyfileobj(f, out)
+            f.close()
+        return positions
+
+
+def _records(source_path):
+    """Продукты выгрузки с ключом ранга: короткие названия раньше длинных"""
+    for code, name, brand, calories in iter_dump(source_path):
+        name = ' '.join(name.split())
+        if not name or calories is None:
+            continue
+        brand = ' '.join(brand.split())
+        normalized_name = normalize_text(name)
+        yield (len(normalized_name), normalized_name, normalize_text(brand), code, name, brand, calories)
+
+
+def build_index(source_path, out_path):
+    """Собирает индекс из выгрузки потоково; продукты без названия или калорийности пропускаются.
+
+    Записи и пары (слово, запись) сортируются внешней сортировкой, поэтому
+    память не зависит от размера выгрузки. Номер записи — её ранг: продукты
+    с коротким названием идут первыми, и списки записей по каждому слову
+    упорядочены от более подходящих к менее подходящим.
+    """
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    tmpdir = tempfile.mkdtemp(prefix='food-index-', dir=os.path.dirname(out_path) or '.')
+    try:
+        records = _BlobWriter(tmpdir, 'records')
+
+        def postings():
+            for record_id, (_, normalized_name, normalized_brand, code, name, brand, calories) in enumerate(
+                    _external_sort(_records(source_path), tmpdir, 'records-')):
+                records.add(_KCAL.pack(calories) + _SEP.join(
+                    (code, name, brand, normalized_name, normalized_brand)).encode('utf-8'))
+                for token in set(f"{normalized_name} {normalized_brand}".split()):
+                    yield token, record_id
+
+        tokens = _BlobWriter(tmpdir, 'tokens')
+        lists = _BlobWriter(tmpdir, 'postings')
+        current, ids = None, array('I')
+        for token, record_id in _external_sort(postings(), tmpdir, 'tokens-'):
+            if token != current:
+                if current is not None:
+                    tokens.add(current.encode('utf-8'))
+                    lists.add(_pack_ids(ids), len(ids))
+                current, ids = token, array('I')
+            ids.append(record_id)
+        if current is not None:
+            tokens.add(current.encode('utf-8'))
+            lists.add(_pack_ids(ids), len(ids))
+
+        tmp_path = out_path + '.tmp'
+        with open(tmp_path, 'wb') as out:
+            out.write(b'\x00' * _HEADER.size)
+            rec_offsets, rec_blob = records.copy_to(out)
+            tok_offsets, tok_blob = tokens.copy_to(out)
+            post_offsets, post_blob = lists.copy_to(out)
+            out.seek(0)
+            out.write(_HEADER.pack(
+                _MAGIC, records.count, tokens.count, rec_offsets, rec_blob,
+                tok_offsets, tok_blob, post_offsets, post_blob))
+        os.replace(tmp_path, out_path)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return records.count, tokens.count
+
+
+def _pack_ids(ids):
+    if sys.byteorder != 'little':
+        ids.byteswap()
+    return ids.tobytes()
+
+
+class FoodIndex:
+    """Индекс продуктов поверх mmap: префиксный поиск по словам названия и бренда.
+
+    Для каждого слова хранится упорядоченный по рангу список записей. Запрос
+    берёт записи по самому редкому из своих слов, проверяет остальные слова
+    по заранее нормализованному названию записи и останавливается, набрав
+    limit + SCORE_WINDOW совпадений.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, self.records_count, self.tokens_count, self._rec_offsets, self._rec_blob,
+         self._tok_offsets, self._tok_blob, self._post_offsets,
+         self._post_blob) = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError(f"{path}: не индекс продуктов или индекс старого формата")
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    def _bounds(self, offsets_pos, i):
+        return struct.unpack_from('<QQ', self._mm, offsets_pos + _OFFSET.size * i)
+
+    def _blob(self, offsets_pos, blob_pos, i):
+        start, end = self._bounds(offsets_pos, i)
+        return self._mm[blob_pos + start:blob_pos + end]
+
+    def _token(self, i):
+        return self._blob(self._tok_offsets, self._tok_blob, i)
+
+    def _entry(self, record_id):
+        entry = self._blob(self._rec_offsets, self._rec_blob, record_id)
+        calories = _KCAL.unpack_from(entry)[0]
+        code, name, brand, normalized_name, normalized_brand = entry[_KCAL.size:].decode('utf-8').split(_SEP)
+        return code, name, brand, round(calories, 1), normalized_name, normalized_brand
+
+    def record(self, record_id):
+        """Возвращает (code, name, brand, kcal) по номеру записи"""
+        return self._entry(record_id)[:4]
+
+    def _token_range(self, prefix):
+        """Слова с данным префиксом: номера lo <= i < hi в словаре"""
+        prefix = prefix.encode('utf-8')
+        lo, hi = 0, self.tokens_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._token(mid) < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        start = lo
+        # Все слова с префиксом меньше prefix + максимальный байт
+        upper = prefix + b'\xff'
+        hi = self.tokens_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._token(mid) < upper:
+                lo = mid + 1
+            else:
+                hi = mid
+        return start, lo
+
+    def _id(self, i):
+        return _ID.unpack_from(self._mm, self._post_blob + _ID.size * i)[0]
+
+    def _lower_bound(self, lo, hi, record_id):
+        """Первая позиция в lo..hi списков, где номер записи >= record_id"""
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._id(mid) < record_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _ids(self, start, end):
+        for i in range(start, end):
+            yield self._id(i)
+
+    def _search(self, query, limit):
+        words = normalize_text(query).split()
+        if not words:
+            return []
+
+        ranges = []
+        for word in dict.fromkeys(words):
+            lo, hi = self._token_range(word)
+            start = self._bounds(self._post_offsets, lo)[0]
+            end = self._bounds(self._post_offsets, hi)[0]
+            if start == end:
+                return []
+            ranges.append((end - start, hi - lo, word, lo, hi))
+        ranges.sort()
+
+        # Списки слов с не слишком общим префиксом пересекаются по номерам
+        # записей; слова с очень общим префиксом проверяются по названию
+        cursors = [
+            _WordPostings(self, lo, hi) for _, tokens, _, lo, hi in ranges
+            if tokens <= MAX_MERGED_TOKENS
+        ]
+        checked_words = [word for _, tokens, word, _, _ in ranges if tokens > MAX_MERGED_TOKENS]
+        if cursors:
+            candidates = self._intersect(cursors)
+        else:
+            # Все префиксы общие: записи по самому редкому из них подряд
+            count, _, word, lo, hi = ranges[0]
+            start = self._bounds(self._post_offsets, lo)[0]
+            candidates = self._ids(start, start + count)
+            checked_words.remove(word)
+
+        normalized_query = ' '.join(words)
+        scored = []
+        for checked, record_id in enumerate(candidates):
+            if checked >= MAX_CANDIDATES or len(scored) >= limit + SCORE_WINDOW:
+                break
+
+            code, name, brand, calories, normalized_name, normalized_brand = self._entry(record_id)
+            if checked_words:
+                record_words = f"{normalized_name} {normalized_brand}".split()
+                if not all(any(w.startswith(word) for w in record_words) for word in checked_words):
+                    continue
+
+            score = (
+                normalized_name != normalized_query,
+                not normalized_name.startswith(normalized_query),
+                len(normalized_name)
+            )
+            scored.append((score, record_id, (code, name, brand, calories)))
+
+        scored.sort(key=lambda item: (item[0], item[1]))
+        return [record for _, _, record in scored[:limit]]
+
+    def _intersect(self, cursors):
+        """Номера записей, которые есть у всех слов, по возрастанию (то есть по рангу)"""
+        record_id = 0
+        while True:
+            candidate = cursors[0].seek(record_id)
+            if candidate is None:
+                return
+            for cursor in cursors[1:]:
+                found = cursor.seek(candidate)
+                if found is None:
+                    return
+                if found != candidate:
+                    record_id = found
+                    break
+            else:
+                yield candidate
+                record_id = candidate + 1
+
+    def search(self, query, limit=3):
+        """Результаты в том же виде, что и search_food_products"""
+        results = []
+        for code, name, brand, calories in self._search(query, limit):
+            results.append({
+                'name': f"{brand} - {name}" if brand else name,
+                'calories': calories,
+                'id': code
+            })
+        return results
+
+    def lookup(self, query):
+        """Лучшее совпадение в виде (calories, product_name, 100) или None"""
+        found = self._search(query, 1)
+        if not found:
+            return None
+        _, name, _, calories = found[0]
+        return calories, name, 100
+
+
+class _WordPostings:
+    """Объединение списков записей всех слов словаря с одним префиксом"""
+
+    def __init__(self, index, lo, hi):
+        self.index = index
+        self.lists = [list(index._bounds(index._post_offsets, i)) for i in range(lo, hi)]
+
+    def seek(self, record_id):
+        """Наименьший номер записи >= record_id или None; позиции только растут"""
+        best = None
+        for bounds in self.lists:
+            position, end = bounds
+            position = bounds[0] = self.index._lower_bound(position, end, record_id)
+            if position < end:
+                found = self.index._id(position)
+                if best is None or found < best:
+                    best = found
+        return best
+
+
+_index = None
+_index_loaded = False
+
+
+def load_index(path=None):
+    """Открывает индекс, если файл существует; возвращает его или None"""
+    global _index, _index_loaded
+    path = path or FOOD_INDEX_PATH
+    if _index is None and os.path.exists(path):
+        try:
+            _index = FoodIndex(path)
+            logger.info(f"Локальный индекс продуктов: {_index.records_count} записей")
+        except (OSError, ValueError) as e:
+            logger.error(f"Не удалось открыть индекс продуктов {path}: {e}")
+    _index_loaded = True
+    return _index
+
+
+def get_index():
+    """Индекс продуктов; открывается при первом обращении, если не открыт заранее"""
+    if not _index_loaded:
+        load_index()
+    return _index
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Сборка локального индекса продуктов из выгрузки OpenFoodFacts")
+    parser.add_argument('source', help="CSV или JSONL выгрузка (можно .gz)")
+    parser.add_argument('-o', '--output', default=FOOD_INDEX_PATH)
+    args = parser.parse_args()
+
+    records, tokens = build_index(args.source, args.output)
+    print(f"Готово: {records} продуктов, {tokens} слов -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
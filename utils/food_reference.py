@@ -0,0 +1,108 @@
+"""Встроенный справочник средней калорийности продуктов (food_reference.tsv).
+
+Названия приводятся к основам слов (stem), поэтому «бананы», «Гречка
+варёная» и «грудка куриная» находятся точно. Для опечаток и неполных
+названий есть нечёткий поиск по триграммам основ; каждое совпадение
+возвращается с оценкой уверенности от 0 до 1.
+"""
+import logging
+import os
+from collections import Counter, namedtuple
+
+from .text import normalize_text, stem
+
+logger = logging.getLogger(__name__)
+
+FOOD_REFERENCE_PATH = os.getenv(
+    "FOOD_REFERENCE_PATH", os.path.join(os.path.dirname(__file__), 'food_reference.tsv'))
+
+FoodMatch = namedtuple('FoodMatch', 'name kcal score')
+
+
+def _key(text):
+    """Основы слов в алфавитном порядке: порядок слов в названии не важен"""
+    return ' '.join(sorted(stem(word) for word in normalize_text(text).split()))
+
+
+def _trigrams(key):
+    padded = f" {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FoodReference:
+    def __init__(self, entries):
+        """entries — пары (название, ккал/100 г)"""
+        self._entries = []
+        self._exact = {}
+        self._postings = {}
+        for name, kcal in entries:
+            key = _key(name)
+            if not key or key in self._exact:
+                continue
+            entry_id = len(self._entries)
+            trigrams = _trigrams(key)
+            self._entries.append((name, kcal, len(trigrams)))
+            self._exact[key] = entry_id
+            for trigram in trigrams:
+                self._postings.setdefault(trigram, []).append(entry_id)
+
+    @classmethod
+    def load(cls, path=FOOD_REFERENCE_PATH):
+        entries = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                name, kcal = line.split('\t')
+                entries.append((name, float(kcal)))
+        return cls(entries)
+
+    def match(self, query):
+        """Лучшее совпадение с оценкой уверенности или None"""
+        key = _key(query)
+        if not key:
+            return None
+
+        entry_id = self._exact.get(key)
+        if entry_id is not None:
+            name, kcal, _ = self._entries[entry_id]
+            return FoodMatch(name, kcal, 1.0)
+
+        # Коэффициент Дайса по общим триграммам запроса и названия
+        trigrams = _trigrams(key)
+        common = Counter()
+        for trigram in trigrams:
+            common.update(self._postings.get(trigram, ()))
+        if not common:
+            return None
+
+        best_id, best_score = None, 0.0
+        for entry_id, shared in common.items():
+            score = 2 * shared / (len(trigrams) + self._entries[entry_id][2])
+            # При равной оценке — более общее (короткое) название
+            if score > best_score or (
+                    score == best_score and len(self._entries[entry_id][0]) < len(self._entries[best_id][0])):
+                best_id, best_score = entry_id, score
+
+        name, kcal, _ = self._entries[best_id]
+        return FoodMatch(name, kcal, round(best_score, 3))
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_reference = None
+
+
+def get_reference():
+    """Справочник, загружаемый при первом обращении"""
+    global _reference
+    if _reference is None:
+        _reference = FoodReference.load()
+        logger.info(f"Справочник калорийности: {len(_reference)} продуктов")
+    return _reference
+
+
+def match_food(query):
+    return get_reference().match(query)
@@ -0,0 +1,32 @@
+import os
+
+# Общий пул соединений для всех внешних API
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 100))
+HTTP_POOL_SIZE_PER_HOST = int(os.getenv("HTTP_POOL_SIZE_PER_HOST", 20))
+
+_session = None
+
+
+def get_session():
+    """Возвращает общую aiohttp-сессию, создавая её при первом обращении"""
+    global _session
+    if _session is None or _session.closed:
+        # aiohttp импортируется при первом запросе, а не при старте бота
+        import aiohttp
+
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_SIZE,
+            limit_per_host=HTTP_POOL_SIZE_PER_HOST,
+            ttl_dns_cache=300,
+            keepalive_timeout=30
+        )
+        _session = aiohttp.ClientSession(connector=connector)
+    return _session
+
+
+async def close_session(*args):
+    """Закрывает общую сессию (подходит как post_shutdown-хук)"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
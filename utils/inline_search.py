@@ -0,0 +1,127 @@
+"""Поиск продуктов для inline-запросов (@bot гречка) по мере набора.
+
+Клиент Telegram присылает запрос на каждое нажатие клавиши, поэтому:
+- результаты кэшируются по запросу; продолжение запроса («гре» → «греч»)
+  отвечается фильтром прежних результатов локального индекса, если тот
+  вернул все совпадения;
+- поиск в OpenFoodFacts начинается, только если за INLINE_DEBOUNCE
+  секунд от пользователя не пришло более нового запроса.
+"""
+import asyncio
+import os
+
+from .cache import TTLCache
+from .food_api import search_food_products
+from .food_index import get_index
+from .food_reference import match_food
+from .metrics import INLINE_SUPERSEDED, register_cache
+from .text import normalize_text
+
+# Пауза в наборе, после которой запрос считается законченным, сек
+INLINE_DEBOUNCE = float(os.getenv("INLINE_DEBOUNCE", 0.3))
+# Более короткие запросы ищутся только в справочнике и кэше
+INLINE_MIN_QUERY = int(os.getenv("INLINE_MIN_QUERY", 3))
+INLINE_RESULTS = int(os.getenv("INLINE_RESULTS", 10))
+# Совпадение со справочником, достаточное, чтобы показать его первым
+INLINE_REFERENCE_MIN_SCORE = float(os.getenv("INLINE_REFERENCE_MIN_SCORE", 0.6))
+
+
+def _matches(words, name):
+    """Каждое слово запроса — начало какого-нибудь слова названия"""
+    name_words = normalize_text(name).split()
+    return all(any(word.startswith(query_word) for word in name_words) for query_word in words)
+
+
+class PrefixCache:
+    """Результаты поиска по нормализованному запросу.
+
+    Для каждого запроса хранится, полон ли список. Полным бывает только
+    ответ локального индекса, который ищет по началам слов: если он вернул
+    меньше limit результатов, других совпадений нет, и ответ на любое
+    продолжение запроса — подмножество этого списка. Поиск OpenFoodFacts
+    полнотекстовый, по коротким запросам он может вернуть посторонние
+    продукты, поэтому его списки полными не считаются.
+    """
+
+    def __init__(self, maxsize, ttl, limit=INLINE_RESULTS):
+        self.limit = limit
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def set(self, query, results, complete=False):
+        self.cache.set(query, (results, complete and len(results) < self.limit))
+
+    def get(self, query):
+        """Результаты для query без поиска или None"""
+        hit = self.cache.get(query)
+        if hit is not None:
+            return hit[0]
+
+        # Самый длинный уже найденный префикс с полным списком
+        words = query.split()
+        for end in range(len(query) - 1, 0, -1):
+            hit = self.cache.peek(query[:end])
+            if hit is None:
+                continue
+            results, complete = hit
+            filtered = [result for result in results if _matches(words, result['name'])]
+            # Пустой фильтр — не ответ: лучше поискать заново
+            if filtered and (complete or len(filtered) >= self.limit):
+                return filtered[:self.limit]
+            return None
+        return None
+
+
+_cache = PrefixCache(
+    maxsize=int(os.getenv("INLINE_CACHE_SIZE", 20000)),
+    ttl=int(os.getenv("INLINE_CACHE_TTL", 3600))
+)
+register_cache('inline', _cache.cache)
+
+# Последний запрос каждого пользователя, ожидающий окончания паузы
+_latest = {}
+
+
+async def _debounce(user_id):
+    """True, если за INLINE_DEBOUNCE от пользователя не пришло нового запроса"""
+    token = object()
+    _latest[user_id] = token
+    await asyncio.sleep(INLINE_DEBOUNCE)
+    if _latest.get(user_id) is not token:
+        INLINE_SUPERSEDED.inc()
+        return False
+    del _latest[user_id]
+    return True
+
+
+def _reference(query):
+    match = match_food(query)
+    if match is None or match.score < INLINE_REFERENCE_MIN_SCORE:
+        return []
+    return [{'name': match.name, 'calories': match.kcal, 'id': None}]
+
+
+async def inline_search(user_id, query):
+    """Продукты для inline-запроса или None, если запрос уже вытеснен новым"""
+    normalized = normalize_text(query)
+    if not normalized:
+        return []
+
+    found = _cache.get(normalized)
+    if found is None and len(normalized) >= INLINE_MIN_QUERY:
+        # Локальный индекс быстрый, его спрашиваем без паузы
+        index = get_index()
+        if index is not None:
+            found = index.search(query, INLINE_RESULTS)
+        if found:
+            _cache.set(normalized, found, complete=True)
+        else:
+            if not await _debounce(user_id):
+                return None
+            found = await search_food_products(query, limit=INLINE_RESULTS)
+            # Пустой ответ может быть и ошибкой API, его не кэшируем
+            if found:
+                _cache.set(normalized, found)
+
+    reference = _reference(query)
+    names = {item['name'] for item in reference}
+    return reference + [item for item in found or () if item['name'] not in names]
@@ -0,0 +1,207 @@
+"""Логирование бота через очередь: обработчики только кладут запись в очередь,
+а форматирование и запись в поток делает отдельный поток QueueListener.
+
+Записи пишутся в JSON по строке на запись (LOG_FORMAT=text — в прежнем
+текстовом виде). Частые события, например по каждому сообщению, идут через
+EventLog с выборкой и ограничением частоты.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# json или text
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Сколько записей может ждать в очереди; лишние отбрасываются, а не блокируют бота
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+# Не больше стольких записей в секунду с одного места в коде, остальные считаются
+LOG_RATE_LIMIT = float(os.getenv("LOG_RATE_LIMIT", 20))
+# Доля сообщений пользователей, попадающих в лог событий, и их предел в секунду
+LOG_MESSAGE_SAMPLE = float(os.getenv("LOG_MESSAGE_SAMPLE", 0.01))
+LOG_MESSAGE_RATE = float(os.getenv("LOG_MESSAGE_RATE", 50))
+
+# Атрибуты LogRecord, которые не являются полями события
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна строка JSON на запись; поля из extra попадают в объект как есть"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Прежний текстовый формат, поля события дописываются как key=value"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = [f"{key}={value}" for key, value in vars(record).items()
+                  if key not in _RECORD_ATTRS and not key.startswith('_')]
+        return f"{line} {' '.join(fields)}" if fields else line
+
+
+class RateLimitFilter(logging.Filter):
+    """Пропускает не больше rate записей в секунду с одной строки кода.
+
+    Число отброшенных записей добавляется полем suppressed к следующей
+    пропущенной записи с того же места, чтобы при сбое внешнего API лог не
+    разрастался на тысячи одинаковых строк.
+    """
+
+    def __init__(self, rate=LOG_RATE_LIMIT):
+        super().__init__()
+        self.rate = rate
+        self._windows = {}
+
+    def filter(self, record):
+        if not self.rate:
+            return True
+        key = (record.name, record.lineno)
+        second = int(record.created)
+        window = self._windows.get(key)
+        if window is None or window[0] != second:
+            suppressed = window[2] if window else 0
+            self._windows[key] = [second, 1, 0]
+            if suppressed:
+                record.suppressed = suppressed
+            return True
+        if window[1] < self.rate:
+            window[1] += 1
+            return True
+        window[2] += 1
+        return False
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который не форматирует запись в вызывающем потоке
+    и при переполненной очереди отбрасывает запись вместо ожидания"""
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Форматирование — в потоке QueueListener; здесь только снимок
+        # аргументов, чтобы их не успели изменить до записи
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _TokenBucket:
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class EventLog:
+    """Структурированные события с выборкой и ограничением частоты.
+
+    Решение, писать ли событие, принимается до создания записи, так что
+    невыбранные события почти ничего не стоят.
+    """
+
+    def __init__(self, name, sample=1.0, rate=0):
+        self.logger = logging.getLogger(name)
+        self.sample = sample
+        self._bucket = _TokenBucket(rate) if rate else None
+        self.limited = 0
+
+    def emit(self, event, level=logging.INFO, **fields):
+        if self.sample < 1 and random.random() >= self.sample:
+            return
+        if not self.logger.isEnabledFor(level):
+            return
+        if self._bucket is not None and not self._bucket.take():
+            self.limited += 1
+            return
+        if self.sample < 1:
+            fields['sample'] = self.sample
+        self.logger.log(level, event, extra=fields)
+
+
+# События по каждому обработанному сообщению пользователя
+message_events = EventLog('bot.messages', sample=LOG_MESSAGE_SAMPLE, rate=LOG_MESSAGE_RATE)
+
+
+def dropped_records():
+    """Сколько записей отброшено из-за переполненной очереди"""
+    return _handler.dropped if _handler is not None else 0
+
+
+def setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, stream=None):
+    """Настраивает корневой логгер на запись через очередь; повторный вызов ничего не делает"""
+    global _listener, _handler
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(TextFormatter() if fmt == 'text' else JsonFormatter())
+
+    _handler = _NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    _handler.addFilter(RateLimitFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    root.setLevel(level)
+    # Логи запросов httpx на каждый вызов Bot API слишком подробны для INFO
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Дописывает записи из очереди и останавливает поток записи"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,302 @@
+"""Метрики бота в текстовом формате Prometheus.
+
+Отдаются по GET /metrics (на сервере вебхука или на METRICS_PORT) и могут
+быть сохранены в файл METRICS_DUMP_PATH при остановке.
+"""
+import functools
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from .log import dropped_records, message_events
+
+logger = logging.getLogger(__name__)
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+METRICS_DUMP_PATH = os.getenv("METRICS_DUMP_PATH")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _default(self):
+        return self.labels()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._function = None
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        """Значение вычисляется при каждом съёме метрик"""
+        self._function = function
+
+    def get(self):
+        return self._function() if self._function else self.value
+
+    def render(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {self.get()}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+    _new_child = _Value
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+    _new_child = _Value
+
+    def set(self, value):
+        self._default().set(value)
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def render(self, name, labelnames, values):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labelnames, values, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labelnames, values, [('le', '+Inf')])} {self.count}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, values)} {self.sum}")
+        lines.append(f"{name}_count{_format_labels(labelnames, values)} {self.count}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+REGISTRY = Registry()
+
+HANDLER_LATENCY = Histogram(
+    'bot_handler_seconds', "Время работы обработчика команды", ['handler'])
+HANDLER_IN_FLIGHT = Gauge(
+    'bot_handler_in_flight', "Обработчиков выполняется сейчас", ['handler'])
+HANDLER_ERRORS = Counter(
+    'bot_handler_errors_total', "Исключения в обработчиках", ['handler'])
+UPSTREAM_LATENCY = Histogram(
+    'bot_upstream_seconds', "Время запроса к внешнему API", ['upstream'])
+UPSTREAM_IN_FLIGHT = Gauge(
+    'bot_upstream_in_flight', "Запросов к внешнему API в процессе", ['upstream'])
+UPSTREAM_ERRORS = Counter(
+    'bot_upstream_errors_total', "Ошибки запросов к внешнему API", ['upstream', 'error'])
+UPSTREAM_COALESCED = Counter(
+    'bot_upstream_coalesced_total', "Запросы, присоединившиеся к такому же уже идущему", ['upstream'])
+UPSTREAM_CIRCUIT_STATE = Gauge(
+    'bot_upstream_circuit_state', "Размыкатель цепи: 0 — замкнута, 1 — разомкнута, 2 — пробный вызов",
+    ['upstream'])
+CACHE_STALE = Counter(
+    'bot_cache_stale_served_total', "Ответы устаревшим значением, пока свежее запрашивается", ['cache'])
+INLINE_SUPERSEDED = Counter(
+    'bot_inline_superseded_total', "Inline-запросы, вытесненные более новым запросом того же пользователя")
+OUTBOUND_MESSAGES = Counter(
+    'bot_outbound_messages_total', "Сообщения очереди отправки по результату", ['result'])
+OUTBOUND_QUEUE = Gauge('bot_outbound_queue', "Сообщений ждёт в очереди отправки")
+REMINDERS_SCHEDULED = Gauge('bot_reminders_scheduled', "Пользователей с запланированными напоминаниями")
+CACHE_HITS = Gauge('bot_cache_hits', "Попадания в кэш", ['cache'])
+CACHE_MISSES = Gauge('bot_cache_misses', "Промахи кэша", ['cache'])
+CACHE_SIZE = Gauge('bot_cache_entries', "Записей в кэше", ['cache'])
+CACHE_HIT_RATIO = Gauge('bot_cache_hit_ratio', "Доля попаданий в кэш", ['cache'])
+LOG_DROPPED = Gauge('bot_log_dropped', "Записи лога, отброшенные из-за переполненной очереди")
+LOG_DROPPED.labels().set_function(dropped_records)
+
+
+def timed_handler(callback):
+    """Декоратор обработчика: время, число выполняющихся и исключения.
+
+    По выборке сообщений пишет событие в лог bot.messages.
+    """
+    name = callback.__name__
+    latency = HANDLER_LATENCY.labels(name)
+    in_flight = HANDLER_IN_FLIGHT.labels(name)
+    errors = HANDLER_ERRORS.labels(name)
+
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        in_flight.inc()
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = await callback(*args, **kwargs)
+            ok = True
+            return result
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            latency.observe(elapsed)
+            in_flight.dec()
+            user = getattr(args[0], 'effective_user', None) if args else None
+            message_events.emit(
+                'message', handler=name, user_id=user and user.id,
+                duration_ms=round(elapsed * 1000, 1), ok=ok)
+
+    return wrapper
+
+
+@contextmanager
+def track_upstream(upstream):
+    """Учитывает один запрос к внешнему API; исключения считаются ошибками"""
+    in_flight = UPSTREAM_IN_FLIGHT.labels(upstream)
+    in_flight.inc()
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        UPSTREAM_ERRORS.labels(upstream, type(e).__name__).inc()
+        raise
+    finally:
+        UPSTREAM_LATENCY.labels(upstream).observe(time.perf_counter() - started)
+        in_flight.dec()
+
+
+def upstream_error(upstream, error):
+    """Ошибка без исключения, например HTTP-статус не 200"""
+    UPSTREAM_ERRORS.labels(upstream, error).inc()
+
+
+def register_cache(name, cache):
+    """Публикует статистику TTLCache"""
+    CACHE_HITS.labels(name).set_function(lambda: cache.hits)
+    CACHE_MISSES.labels(name).set_function(lambda: cache.misses)
+    CACHE_SIZE.labels(name).set_function(lambda: len(cache))
+    CACHE_HIT_RATIO.labels(name).set_function(lambda: cache.stats()['hit_ratio'])
+
+
+def render():
+    return REGISTRY.render()
+
+
+def dump(path=None):
+    path = path or METRICS_DUMP_PATH
+    if path:
+        REGISTRY.dump(path)
+
+
+async def handle_metrics(request):
+    """aiohttp-обработчик GET /metrics"""
+    from aiohttp import web
+    return web.Response(text=render(), content_type='text/plain', charset='utf-8')
+
+
+async def start_metrics_server(port=METRICS_PORT, listen='0.0.0.0'):
+    """Отдельный HTTP-сервер с /metrics; возвращает runner или None, если порт не задан"""
+    if not port:
+        return None
+
+    from aiohttp import web
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app, handle_signals=False, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, listen, port).start()
+    logger.info(f"Метрики на :{port}/metrics")
+    return runner
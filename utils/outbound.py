@@ -0,0 +1,141 @@
+"""Очередь исходящих сообщений, которые бот отправляет сам (напоминания).
+
+Ответы на команды идут напрямую, а рассылки — через OutboundQueue: общий
+токен-бакет держит её ниже глобального лимита Bot API (около 30 сообщений в
+секунду) с запасом OUTBOUND_RATE для ответов, поэтому всплеск напоминаний
+не задерживает интерактивные команды. RetryAfter от Telegram
+приостанавливает всю очередь на указанное время, после чего сообщение
+отправляется повторно. В режиме sharded у каждого обработчика своя очередь,
+и лимит делится между ними поровну (share).
+"""
+import asyncio
+import logging
+import os
+import time
+
+from telegram.error import Forbidden, RetryAfter, TelegramError
+
+from .metrics import OUTBOUND_MESSAGES, OUTBOUND_QUEUE
+
+logger = logging.getLogger(__name__)
+
+# Сообщений в секунду из очереди и сколько можно отправить подряд
+OUTBOUND_RATE = float(os.getenv("OUTBOUND_RATE", 20))
+OUTBOUND_BURST = int(os.getenv("OUTBOUND_BURST", 5))
+OUTBOUND_QUEUE_SIZE = int(os.getenv("OUTBOUND_QUEUE_SIZE", 10000))
+# Одновременных запросов sendMessage: чтобы задержка сети не ограничивала скорость
+OUTBOUND_SENDERS = int(os.getenv("OUTBOUND_SENDERS", 4))
+OUTBOUND_RETRIES = int(os.getenv("OUTBOUND_RETRIES", 3))
+
+
+class TokenBucket:
+    """rate разрешений в секунду, до burst подряд; pause() останавливает выдачу"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._resume_at = 0.0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self._resume_at:
+                await asyncio.sleep(self._resume_at - now)
+                continue
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds):
+        self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+        self._tokens = 0
+
+
+class OutboundQueue:
+    """Ограниченная по скорости отправка сообщений в фоне.
+
+    send() не ждёт отправки; если очередь переполнена, сообщение отбрасывается.
+    on_forbidden(chat_id) вызывается, когда пользователь заблокировал бота.
+    """
+
+    def __init__(self, rate=OUTBOUND_RATE, burst=OUTBOUND_BURST, maxsize=OUTBOUND_QUEUE_SIZE,
+                 senders=OUTBOUND_SENDERS, on_forbidden=None):
+        self.bucket = TokenBucket(rate, burst)
+        self.maxsize = maxsize
+        self.senders = senders
+        self.on_forbidden = on_forbidden
+        self.bot = None
+        self._queue = None
+        self._tasks = []
+
+    def share(self, parts):
+        """Оставляет этой очереди 1/parts лимита: остальное у очередей других процессов"""
+        self.bucket = TokenBucket(self.bucket.rate / parts, max(1, self.bucket.burst // parts))
+
+    def send(self, chat_id, text):
+        """Ставит сообщение в очередь; False, если очередь переполнена или не запущена"""
+        if self._queue is None:
+            return False
+        try:
+            self._queue.put_nowait((chat_id, text))
+        except asyncio.QueueFull:
+            OUTBOUND_MESSAGES.labels('dropped').inc()
+            return False
+        return True
+
+    async def _sender(self):
+        while True:
+            chat_id, text = await self._queue.get()
+            try:
+                await self._deliver(chat_id, text)
+            except Exception as e:
+                logger.error(f"Ошибка отправки сообщения: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, chat_id, text):
+        for _ in range(OUTBOUND_RETRIES):
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id, text)
+            except RetryAfter as e:
+                OUTBOUND_MESSAGES.labels('retry_after').inc()
+                self.bucket.pause(e.retry_after)
+                continue
+            except Forbidden:
+                OUTBOUND_MESSAGES.labels('forbidden').inc()
+                if self.on_forbidden is not None:
+                    await self.on_forbidden(chat_id)
+                return
+            except TelegramError as e:
+                OUTBOUND_MESSAGES.labels('error').inc()
+                logger.warning(f"Сообщение для {chat_id} не отправлено: {e}")
+                return
+            OUTBOUND_MESSAGES.labels('sent').inc()
+            return
+        OUTBOUND_MESSAGES.labels('dropped').inc()
+
+    def __len__(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self, bot):
+        if self._queue is None:
+            self.bot = bot
+            self._queue = asyncio.Queue(self.maxsize)
+            self._tasks = [asyncio.create_task(self._sender()) for _ in range(self.senders)]
+            OUTBOUND_QUEUE.labels().set_function(self.__len__)
+
+    async def close(self, *args):
+        """Останавливает отправку; неотправленные сообщения теряются"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._queue is not None and self._queue.qsize():
+            logger.info(f"Не отправлено сообщений из очереди: {self._queue.qsize()}")
+        self._queue = None
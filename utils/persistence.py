@@ -0,0 +1,258 @@
+"""Сохранение состояний диалогов и context.user_data между перезапусками.
+
+Application раз в PERSISTENCE_INTERVAL передаёт только изменившиеся записи
+(пользователей, обработавших обновление, и диалоги, сменившие состояние);
+SQLitePersistence копит их и пишет одной транзакцией, пропуская user_data,
+не изменившиеся с последней записи, поэтому стоимость сброса зависит от
+активности, а не от числа пользователей. user_data
+пользователя читается из базы лениво, при его первом обновлении после
+запуска или после вытеснения из кэша недавних пользователей. Состояния диалогов загружаются при запуске целиком: в базе есть
+только незавершённые диалоги, завершённые удаляются.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+PERSISTENCE_DB_PATH = os.getenv("PERSISTENCE_DB_PATH", "data/state.db")
+# Как часто Application передаёт изменения, сек
+PERSISTENCE_INTERVAL = float(os.getenv("PERSISTENCE_INTERVAL", 5))
+# Для скольких недавних пользователей помнить, что лежит в базе
+PERSISTENCE_CACHE_SIZE = int(os.getenv("PERSISTENCE_CACHE_SIZE", 100000))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data (
+    user_id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (name, key)
+) WITHOUT ROWID;
+"""
+
+_SELECT_USER_SQL = "SELECT data FROM user_data WHERE user_id = ?"
+_UPSERT_USER_SQL = "INSERT OR REPLACE INTO user_data (user_id, data) VALUES (?, ?)"
+_DELETE_USER_SQL = "DELETE FROM user_data WHERE user_id = ?"
+_SELECT_CONVERSATIONS_SQL = "SELECT key, state FROM conversations WHERE name = ?"
+_UPSERT_CONVERSATION_SQL = "INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)"
+_DELETE_CONVERSATION_SQL = "DELETE FROM conversations WHERE name = ? AND key = ?"
+
+# Данные пользователя, которого нет в _written: их состояние в базе неизвестно
+_UNKNOWN = object()
+# drop_user_data: запись удаляется, и пользователь забывается
+_DROPPED = object()
+
+
+def _digest(data):
+    """Отпечаток JSON вместо копии user_data; None — записи нет"""
+    if data is None or data is _DROPPED:
+        return None
+    return hashlib.blake2b(data.encode(), digest_size=16).digest()
+
+
+class SQLitePersistence(BasePersistence):
+    """Хранит user_data и состояния ConversationHandler (с persistent=True) в SQLite.
+
+    chat_data, bot_data и callback_data не сохраняются. Значения сериализуются
+    в JSON, поэтому в user_data должны лежать только JSON-совместимые данные.
+    """
+
+    def __init__(self, path=PERSISTENCE_DB_PATH, update_interval=PERSISTENCE_INTERVAL,
+                 cache_size=PERSISTENCE_CACHE_SIZE):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+        # user_id → отпечаток JSON в базе (None — записи нет) для недавних
+        # пользователей: их данные уже прочитаны, а неизменившиеся не пишутся
+        self._written = TTLCache(maxsize=cache_size, ttl=float('inf'))
+        # user_id → JSON, None или _DROPPED для удаления; (name, key) → JSON или None
+        self._users = {}
+        # Забранное из _users, пока идёт запись
+        self._writing = {}
+        self._conversations = {}
+        self._write_task = None
+
+    def _connection(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    async def get_user_data(self):
+        # Данные читаются по одному пользователю в refresh_user_data
+        return {}
+
+    def _restored(self, user_id):
+        # Несохранённые данные новее базы: перечитывать её незачем
+        return (user_id in self._users or user_id in self._writing
+                or self._written.get(user_id, _UNKNOWN) is not _UNKNOWN)
+
+    async def refresh_user_data(self, user_id, user_data):
+        if self._restored(user_id):
+            return
+
+        def read():
+            with self._lock:
+                return self._connection().execute(_SELECT_USER_SQL, (user_id,)).fetchone()
+
+        row = await asyncio.to_thread(read)
+        if self._restored(user_id):
+            return
+        if row is None:
+            self._written.set(user_id, None)
+            return
+        self._written.set(user_id, _digest(row[0]))
+        # Записанное в этом процессе новее сохранённого
+        for key, value in json.loads(row[0]).items():
+            user_data.setdefault(key, value)
+
+    async def update_user_data(self, user_id, data):
+        data = json.dumps(data, ensure_ascii=False) if data else None
+        # Application передаёт user_data всех обработавших обновление, даже если
+        # обработчик их не трогал; запись нужна, только если JSON отличается от
+        # последнего записанного (или ещё не записанного) значения
+        if user_id in self._users:
+            if self._users[user_id] == data:
+                return
+        elif self._written.peek(user_id, _UNKNOWN) == _digest(data):
+            return
+        self._users[user_id] = data
+        self._schedule_write()
+
+    async def drop_user_data(self, user_id):
+        self._written.pop(user_id)
+        self._users[user_id] = _DROPPED
+        self._schedule_write()
+
+    async def get_conversations(self, name):
+        def read():
+            with self._lock:
+                return self._connection().execute(_SELECT_CONVERSATIONS_SQL, (name,)).fetchall()
+
+        return {
+            tuple(json.loads(key)): json.loads(state)
+            for key, state in await asyncio.to_thread(read)
+        }
+
+    async def update_conversation(self, name, key, new_state):
+        state = None if new_state is None else json.dumps(new_state)
+        self._conversations[(name, json.dumps(key))] = state
+        self._schedule_write()
+
+    def _schedule_write(self):
+        """Все изменения одного прохода Application пишутся одной транзакцией"""
+        if self._write_task is None:
+            self._write_task = asyncio.create_task(self._write_pending())
+
+    def _take_pending(self):
+        users, self._users = self._users, {}
+        self._writing = users
+        conversations, self._conversations = self._conversations, {}
+        return users, conversations
+
+    def _write(self, users, conversations):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(_UPSERT_USER_SQL, (
+                    (user_id, data) for user_id, data in users.items()
+                    if data is not None and data is not _DROPPED))
+                conn.executemany(_DELETE_USER_SQL, (
+                    (user_id,) for user_id, data in users.items()
+                    if data is None or data is _DROPPED))
+                conn.executemany(_UPSERT_CONVERSATION_SQL, (
+                    (name, key, state) for (name, key), state in conversations.items()
+                    if state is not None))
+                conn.executemany(_DELETE_CONVERSATION_SQL, (
+                    key for key, state in conversations.items() if state is None))
+
+    def _written_users(self, users):
+        self._writing = {}
+        for user_id, data in users.items():
+            if data is _DROPPED:
+                self._written.pop(user_id)
+            else:
+                self._written.set(user_id, _digest(data))
+
+    def _restore_pending(self, users, conversations):
+        """Возвращает несохранённое; более новые изменения остаются"""
+        self._writing = {}
+        self._users = {**users, **self._users}
+        self._conversations = {**conversations, **self._conversations}
+
+    async def _write_pending(self):
+        # Даём Application передать все изменения прохода
+        await asyncio.sleep(0)
+        try:
+            while self._users or self._conversations:
+                users, conversations = self._take_pending()
+                try:
+                    await asyncio.to_thread(self._write, users, conversations)
+                except sqlite3.Error as e:
+                    self._restore_pending(users, conversations)
+                    logger.error(f"Ошибка сохранения состояний диалогов: {e}")
+                    return
+                self._written_users(users)
+        finally:
+            self._write_task = None
+
+    async def flush(self):
+        """Вызывается при остановке Application: дописывает всё и закрывает базу"""
+        if self._write_task is not None:
+            await self._write_task
+        users, conversations = self._take_pending()
+        if users or conversations:
+            self._write(users, conversations)
+            self._written_users(users)
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # chat_data, bot_data и callback_data боту не нужны
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
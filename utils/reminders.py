@@ -0,0 +1,188 @@
+"""Напоминания пить воду для пользователей, включивших их командой /reminders.
+
+Пользователи раскладываются по корзинам планировщика по времени следующей
+проверки с точностью REMINDER_TICK; раз в тик обрабатываются только
+наступившие корзины, поэтому работа за тик не зависит от общего числа
+пользователей. Напоминание отправляется днём по местному времени
+пользователя и только если выпито заметно меньше, чем положено к этому часу.
+Сообщения уходят через OutboundQueue; одному пользователю — не чаще раза в
+REMINDER_INTERVAL, что заодно соблюдает лимит Bot API на один чат.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+
+from .metrics import REMINDERS_SCHEDULED
+
+logger = logging.getLogger(__name__)
+
+# Точность планировщика, сек
+REMINDER_TICK = float(os.getenv("REMINDER_TICK", 60))
+# Период проверки одного пользователя, сек; 0 отключает напоминания
+REMINDER_INTERVAL = float(os.getenv("REMINDER_INTERVAL", 2 * 3600))
+# Дневные часы по местному времени, когда можно напоминать
+REMINDER_START_HOUR = int(os.getenv("REMINDER_START_HOUR", 9))
+REMINDER_END_HOUR = int(os.getenv("REMINDER_END_HOUR", 22))
+# Напоминать, если выпито меньше такой доли положенного к этому часу
+REMINDER_LAG = float(os.getenv("REMINDER_LAG", 0.8))
+
+
+class BucketScheduler:
+    """Планировщик на корзинах: ключ → время срабатывания, округлённое до tick.
+
+    schedule и cancel — O(1); due(now) забирает ключи всех наступивших корзин.
+    """
+
+    def __init__(self, tick):
+        self.tick = tick
+        self._buckets = {}
+        self._slots = {}
+        # Первая ещё не обработанная корзина
+        self._next = None
+
+    def schedule(self, key, when):
+        """Назначает (или переносит) срабатывание key на момент when"""
+        self.cancel(key)
+        slot = int(when // self.tick)
+        if self._next is not None and slot < self._next:
+            slot = self._next
+        self._buckets.setdefault(slot, set()).add(key)
+        self._slots[key] = slot
+
+    def cancel(self, key):
+        slot = self._slots.pop(key, None)
+        if slot is not None:
+            bucket = self._buckets[slot]
+            bucket.discard(key)
+            if not bucket:
+                del self._buckets[slot]
+
+    def due(self, now):
+        """Ключи, время которых наступило к now; они снимаются с расписания"""
+        end = int(now // self.tick)
+        start = self._next if self._next is not None else min(self._buckets, default=end)
+        keys = []
+        for slot in range(start, end + 1):
+            bucket = self._buckets.pop(slot, None)
+            if bucket:
+                for key in bucket:
+                    del self._slots[key]
+                keys.extend(bucket)
+        self._next = end + 1
+        return keys
+
+    def __contains__(self, key):
+        return key in self._slots
+
+    def __len__(self):
+        return len(self._slots)
+
+
+class Reminders:
+    """Напоминания для хранилища store, отправляемые через очередь queue.
+
+    owns(user_id) ограничивает напоминания пользователями этого процесса.
+    """
+
+    def __init__(self, store, queue, tick=REMINDER_TICK, interval=REMINDER_INTERVAL, owns=None):
+        self.store = store
+        self.queue = queue
+        self.interval = interval
+        self.owns = owns
+        self.scheduler = BucketScheduler(tick)
+        # Снятые с расписания в run_due, пока читаются их профили
+        self._checking = set()
+        self._task = None
+        REMINDERS_SCHEDULED.labels().set_function(self.scheduler.__len__)
+
+    async def enable(self, user_id):
+        await self.store.set_reminders(user_id, True)
+        self.scheduler.schedule(user_id, time.time() + self.interval)
+
+    async def disable(self, user_id):
+        self.scheduler.cancel(user_id)
+        self._checking.discard(user_id)
+        await self.store.set_reminders(user_id, False)
+
+    def enabled(self, user_id):
+        return user_id in self.scheduler or user_id in self._checking
+
+    def _check(self, user_id, user, now):
+        """Напоминает, если нужно; возвращает время следующей проверки или None"""
+        if user is None:
+            return None
+
+        hour = (now + user.tz_offset) % 86400 / 3600
+        if hour < REMINDER_START_HOUR or hour >= REMINDER_END_HOUR:
+            until_start = (REMINDER_START_HOUR - hour) % 24 * 3600
+            # Утренние проверки пользователей одного пояса разносятся по интервалу
+            return now + until_start + random.random() * self.interval
+
+        day_part = (hour - REMINDER_START_HOUR) / (REMINDER_END_HOUR - REMINDER_START_HOUR)
+        goal = user.day_water_goal
+        if user.logged_water < REMINDER_LAG * day_part * goal:
+            self.queue.send(
+                user_id,
+                f"Не забудьте про воду: выпито {user.logged_water:.0f} из {goal:.0f} мл.\n"
+                f"Записать: /log_water 250\n"
+                f"Отключить напоминания: /reminders off"
+            )
+        return now + self.interval
+
+    async def run_due(self, now=None):
+        """Проверяет пользователей, чьё время наступило; возвращает их число"""
+        now = time.time() if now is None else now
+        due = self.scheduler.due(now)
+        self._checking.update(due)
+        users = None
+        try:
+            # Пользователей, которых нет в памяти, хранилище читает одним проходом
+            users = await self.store.get_many(due)
+        finally:
+            for user_id in due:
+                # Пока читались профили, напоминания могли выключить или включить заново
+                if user_id not in self._checking or user_id in self.scheduler:
+                    continue
+                self._checking.discard(user_id)
+                if users is None:
+                    # Профили не прочитались: проверим на следующем интервале
+                    when = now + self.interval
+                else:
+                    when = self._check(user_id, users.get(user_id), now)
+                if when is not None:
+                    self.scheduler.schedule(user_id, when)
+            self._checking.difference_update(due)
+        return len(due)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.scheduler.tick)
+            try:
+                await self.run_due()
+            except Exception as e:
+                logger.error(f"Ошибка напоминаний: {e}")
+
+    async def start(self, bot):
+        if self._task is not None or self.interval <= 0:
+            return
+        await self.queue.start(bot)
+        now = time.time()
+        user_ids = await self.store.reminder_users()
+        for user_id in user_ids:
+            if self.owns is None or self.owns(user_id):
+                # Случайный сдвиг, чтобы после запуска проверки не пришлись на один тик
+                self.scheduler.schedule(user_id, now + random.random() * self.interval)
+        logger.info(f"Напоминания запланированы: {len(self.scheduler)}")
+        self._task = asyncio.create_task(self._loop())
+
+    async def close(self, *args):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.queue.close()
@@ -0,0 +1,113 @@
+"""Распределение пользователей по процессам-обработчикам.
+
+Пользователь попадает в один из SHARD_SLOTS слотов по хешу user_id, а карта
+слотов говорит, какой процесс этот слот обслуживает. При изменении числа
+процессов переезжает минимум слотов:
+    python -m utils.sharding resize 8
+"""
+import argparse
+import json
+import os
+import zlib
+
+SHARD_SLOTS = 1024
+SHARD_MAP_PATH = os.getenv("SHARD_MAP_PATH", "data/shard_map.json")
+
+
+def slot_for(user_id):
+    return zlib.crc32(str(user_id).encode()) % SHARD_SLOTS
+
+
+class ShardMap:
+    """Карта слот → номер процесса"""
+
+    def __init__(self, slots):
+        if len(slots) != SHARD_SLOTS:
+            raise ValueError(f"В карте должно быть {SHARD_SLOTS} слотов")
+        self.slots = list(slots)
+
+    @classmethod
+    def balanced(cls, workers):
+        return cls([slot % workers for slot in range(SHARD_SLOTS)])
+
+    @property
+    def workers(self):
+        return max(self.slots) + 1
+
+    def worker_for(self, user_id):
+        return self.slots[slot_for(user_id)]
+
+    def resize(self, workers):
+        """Перераспределяет слоты на workers процессов; возвращает число переехавших слотов"""
+        target = SHARD_SLOTS // workers
+        extra = SHARD_SLOTS % workers
+        quota = [target + (1 if worker < extra else 0) for worker in range(workers)]
+
+        owned = [0] * workers
+        homeless = []
+        for slot, worker in enumerate(self.slots):
+            # Слот остаётся на месте, если его процесс есть и ещё не переполнен
+            if worker < workers and owned[worker] < quota[worker]:
+                owned[worker] += 1
+            else:
+                homeless.append(slot)
+
+        moved = len(homeless)
+        for worker in range(workers):
+            while owned[worker] < quota[worker]:
+                self.slots[homeless.pop()] = worker
+                owned[worker] += 1
+        return moved
+
+    @classmethod
+    def load(cls, path=SHARD_MAP_PATH):
+        with open(path) as f:
+            return cls(json.load(f)['slots'])
+
+    def save(self, path=SHARD_MAP_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'slots': self.slots}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load_or_create(cls, workers, path=SHARD_MAP_PATH):
+        """Загружает карту и подгоняет её под workers процессов"""
+        if os.path.exists(path):
+            shard_map = cls.load(path)
+            if shard_map.workers == workers:
+                return shard_map
+            shard_map.resize(workers)
+        else:
+            shard_map = cls.balanced(workers)
+        shard_map.save(path)
+        return shard_map
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Карта шардов пользователей")
+    parser.add_argument('command', choices=['show', 'resize'])
+    parser.add_argument('workers', type=int, nargs='?')
+    parser.add_argument('--path', default=SHARD_MAP_PATH)
+    args = parser.parse_args()
+
+    if args.command == 'resize':
+        if not args.workers:
+            parser.error("укажите число процессов")
+        if os.path.exists(args.path):
+            shard_map = ShardMap.load(args.path)
+            moved = shard_map.resize(args.workers)
+        else:
+            shard_map = ShardMap.balanced(args.workers)
+            moved = SHARD_SLOTS
+        shard_map.save(args.path)
+        print(f"Переехало слотов: {moved} из {SHARD_SLOTS}")
+    else:
+        shard_map = ShardMap.load(args.path)
+        for worker in range(shard_map.workers):
+            print(f"{worker}: {shard_map.slots.count(worker)} слотов")
+
+
+if __name__ == "__main__":
+    main()
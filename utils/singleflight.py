@@ -0,0 +1,63 @@
+import asyncio
+
+from .metrics import UPSTREAM_COALESCED
+
+_instances = []
+
+
+class SingleFlight:
+    """Объединяет одновременные одинаковые запросы в один.
+
+    Пока запрос по ключу выполняется, остальные вызовы с тем же ключом ждут
+    его и получают тот же результат или то же исключение. Отмена одного из
+    ожидающих (например, по его таймауту) не отменяет общий запрос.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._coalesced = UPSTREAM_COALESCED.labels(name)
+        self._calls = {}
+        _instances.append(self)
+
+    async def do(self, key, function):
+        """Результат function() для key; повторные вызовы присоединяются к идущему"""
+        task = self._calls.get(key)
+        if task is not None:
+            self._coalesced.inc()
+        else:
+            task = self._start(key, function)
+        return await asyncio.shield(task)
+
+    def spawn(self, key, function):
+        """Запускает function() в фоне, если по key ещё ничего не выполняется"""
+        if key not in self._calls:
+            self._start(key, function)
+
+    def _start(self, key, function):
+        task = asyncio.ensure_future(function())
+        self._calls[key] = task
+        task.add_done_callback(lambda done: self._forget(key, done))
+        return task
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Если все ожидающие отменились, исключение никто не заберёт
+        if not task.cancelled():
+            task.exception()
+
+    async def cancel(self):
+        """Отменяет все идущие запросы, в том числе фоновые"""
+        tasks = list(self._calls.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def __len__(self):
+        return len(self._calls)
+
+
+async def cancel_all(*args):
+    """Отменяет запросы всех SingleFlight (подходит как post_shutdown-хук)"""
+    for flight in _instances:
+        await flight.cancel()
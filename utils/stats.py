@@ -0,0 +1,109 @@
+"""Статистика пользователя за 7, 30 и 90 дней для команды /stats.
+
+Дневные суммы уже свёрнуты в таблицу daily при сбросе событий. Для отчёта
+прошедшие дни пользователя читаются оттуда одним запросом по диапазону
+ключа и хранятся в памяти столбцами array — по столбцу на счётчик.
+Прошедшие дни больше не меняются, поэтому столбцы кэшируются до конца дня,
+а сегодняшние суммы берутся из записи пользователя. Отчёт за 90 дней —
+несколько проходов по массивам из 90 чисел.
+"""
+import os
+from array import array
+
+from .cache import TTLCache
+from .metrics import register_cache
+from .storage import DAY_COUNTERS
+
+STATS_PERIODS = (7, 30, 90)
+STATS_DAYS = max(STATS_PERIODS)
+
+_histories = TTLCache(
+    maxsize=int(os.getenv("STATS_CACHE_SIZE", 5000)),
+    ttl=86400
+)
+register_cache('stats', _histories)
+
+
+class History:
+    """Суммы за STATS_DAYS - 1 дней до today по столбцам; последний элемент — вчера"""
+
+    __slots__ = ('today',) + DAY_COUNTERS
+
+    def __init__(self, today, rows):
+        self.today = today
+        first_day = today - (STATS_DAYS - 1)
+        for field in DAY_COUNTERS:
+            setattr(self, field, array('f', [0.0]) * (STATS_DAYS - 1))
+        for day, *values in rows:
+            for field, value in zip(DAY_COUNTERS, values):
+                getattr(self, field)[day - first_day] = value
+
+    def with_today(self, user):
+        """Столбцы за STATS_DAYS дней вместе с сегодняшними суммами user"""
+        return {
+            field: getattr(self, field) + array('f', [getattr(user, field)])
+            for field in DAY_COUNTERS
+        }
+
+
+async def get_history(store, user_id, user):
+    history = _histories.get((user_id, user.day))
+    if history is None:
+        rows = await store.history(user_id, user.day - (STATS_DAYS - 1), user.day)
+        history = History(user.day, rows)
+        _histories.set((user_id, user.day), history)
+    return history
+
+
+def _trailing(hits):
+    count = 0
+    for hit in reversed(hits):
+        if not hit:
+            break
+        count += 1
+    return count
+
+
+def _longest(hits):
+    best = run = 0
+    for hit in hits:
+        run = run + 1 if hit else 0
+        best = max(best, run)
+    return best
+
+
+def summarize(columns, user, days):
+    """Средние и дни выполнения нормы за последние days дней (включая сегодня)"""
+    water = columns['logged_water'][-days:]
+    calories = columns['logged_calories'][-days:]
+    burned = columns['burned_calories'][-days:]
+    extra = columns['extra_water'][-days:]
+
+    active = [i for i in range(days) if water[i] or calories[i] or burned[i]]
+    count = len(active) or 1
+    return {
+        'days': days,
+        'active_days': len(active),
+        'water_avg': sum(water[i] for i in active) / count,
+        'calories_avg': sum(calories[i] for i in active) / count,
+        'burned_avg': sum(burned[i] for i in active) / count,
+        'water_hits': sum(
+            1 for i in active if water[i] and water[i] >= user.water_goal + extra[i]),
+        # Калории в пределах цели с учётом сожжённых, только для дней с едой
+        'calorie_hits': sum(
+            1 for i in active if calories[i] and calories[i] - burned[i] <= user.calorie_goal),
+    }
+
+
+async def user_stats(store, user_id, user):
+    """Сводки за STATS_PERIODS и серии дней с выполненной нормой воды.
+
+    Возвращает (сводки, текущая серия, лучшая серия за STATS_DAYS дней);
+    невыполненная пока норма сегодня текущую серию не обрывает.
+    """
+    columns = (await get_history(store, user_id, user)).with_today(user)
+    water, extra = columns['logged_water'], columns['extra_water']
+    hits = [bool(water[i]) and water[i] >= user.water_goal + extra[i] for i in range(len(water))]
+
+    summaries = [summarize(columns, user, days) for days in STATS_PERIODS]
+    return summaries, _trailing(hits[:-1]) + hits[-1], _longest(hits)
@@ -0,0 +1,419 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+
+from .user_record import UserRecord, local_day
+
+logger = logging.getLogger(__name__)
+
+USERS_DB_PATH = os.getenv("USERS_DB_PATH", "data/users.db")
+# Как часто сбрасывать накопленные события в базу, сек
+STORE_FLUSH_INTERVAL = float(os.getenv("STORE_FLUSH_INTERVAL", 0.5))
+# Сколько пользователей держать в памяти; остальные читаются из базы при обращении
+STORE_CACHE_SIZE = int(os.getenv("STORE_CACHE_SIZE", 100000))
+
+# Виды событий; номер вида — индекс дневного счётчика, который он увеличивает
+WATER, FOOD, BURNED, EXTRA_WATER = range(4)
+DAY_COUNTERS = ('logged_water', 'logged_calories', 'burned_calories', 'extra_water')
+
+PROFILE_FIELDS = ('weight', 'height', 'age', 'activity', 'city',
+                  'water_goal', 'calorie_goal', 'tz_offset')
+DAY_FIELDS = ('day',) + DAY_COUNTERS
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    weight REAL NOT NULL,
+    height REAL NOT NULL,
+    age INTEGER NOT NULL,
+    activity REAL NOT NULL,
+    city TEXT NOT NULL,
+    water_goal REAL NOT NULL DEFAULT 0,
+    calorie_goal REAL NOT NULL DEFAULT 0,
+    logged_water REAL NOT NULL DEFAULT 0,
+    logged_calories REAL NOT NULL DEFAULT 0,
+    burned_calories REAL NOT NULL DEFAULT 0
+)
+"""
+
+# Миграции по PRAGMA user_version: i-я переводит базу из версии i в i + 1
+_MIGRATIONS = [
+    """
+    ALTER TABLE users ADD COLUMN tz_offset INTEGER NOT NULL DEFAULT 10800;
+    ALTER TABLE users ADD COLUMN day INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE users ADD COLUMN extra_water REAL NOT NULL DEFAULT 0;
+    CREATE TABLE events (
+        user_id INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        kind INTEGER NOT NULL,
+        value REAL NOT NULL
+    );
+    CREATE TABLE daily (
+        user_id INTEGER NOT NULL,
+        day INTEGER NOT NULL,
+        logged_water REAL NOT NULL DEFAULT 0,
+        logged_calories REAL NOT NULL DEFAULT 0,
+        burned_calories REAL NOT NULL DEFAULT 0,
+        extra_water REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day)
+    ) WITHOUT ROWID;
+    """,
+    """
+    CREATE TABLE reminders (user_id INTEGER PRIMARY KEY);
+    """,
+]
+
+# Запросы неизменны, поэтому sqlite3 компилирует их один раз и берёт из кэша
+# Сегодняшние суммы берутся из daily: туда сброс прибавляет события, а столбцы
+# дня в users (day, logged_*, extra_water) остались от старых версий и не используются
+_SELECT_SQL = (
+    f"SELECT {', '.join(f'u.{field}' for field in PROFILE_FIELDS)}, "
+    "(:now + u.tz_offset) / 86400, "
+    + ', '.join(f"COALESCE(d.{field}, 0)" for field in DAY_COUNTERS)
+    + " FROM users u LEFT JOIN daily d "
+    "ON d.user_id = u.user_id AND d.day = (:now + u.tz_offset) / 86400 "
+    "WHERE u.user_id = :user_id"
+)
+_UPSERT_SQL = (
+    f"INSERT INTO users (user_id, {', '.join(PROFILE_FIELDS)}) "
+    f"VALUES ({', '.join('?' * (len(PROFILE_FIELDS) + 1))}) "
+    "ON CONFLICT (user_id) DO UPDATE SET "
+    + ', '.join(f"{field} = excluded.{field}" for field in PROFILE_FIELDS)
+)
+_CITIES_SQL = "SELECT DISTINCT city FROM users"
+_USER_CITIES_SQL = "SELECT user_id, city FROM users"
+_GOAL_INPUTS_SQL = "SELECT user_id, weight, activity, city, water_goal FROM users"
+# Профиль мог измениться, пока считались нормы: тогда норму не трогаем
+_UPDATE_GOAL_SQL = (
+    "UPDATE users SET water_goal = ? "
+    "WHERE user_id = ? AND weight = ? AND activity = ? AND city = ?"
+)
+# Ключ daily — (user_id, day), поэтому дни пользователя лежат подряд
+_HISTORY_SQL = (
+    f"SELECT day, {', '.join(DAY_COUNTERS)} FROM daily "
+    "WHERE user_id = ? AND day >= ? AND day < ?"
+)
+_REMINDERS_SQL = "SELECT user_id FROM reminders"
+_ENABLE_REMINDERS_SQL = "INSERT OR IGNORE INTO reminders (user_id) VALUES (?)"
+_DISABLE_REMINDERS_SQL = "DELETE FROM reminders WHERE user_id = ?"
+_INSERT_EVENT_SQL = "INSERT INTO events (user_id, ts, kind, value) VALUES (?, ?, ?, ?)"
+_UPSERT_DAILY_SQL = (
+    f"INSERT INTO daily (user_id, day, {', '.join(DAY_COUNTERS)}) "
+    f"VALUES ({', '.join('?' * (len(DAY_COUNTERS) + 2))}) "
+    "ON CONFLICT (user_id, day) DO UPDATE SET "
+    + ', '.join(f"{field} = {field} + excluded.{field}" for field in DAY_COUNTERS)
+)
+
+
+class UserStore:
+    """Хранилище пользователей в SQLite (WAL) с отложенной записью событий.
+
+    Профили пишутся сразу. Каждое потребление воды, еды или тренировка —
+    событие в журнале events; дневные суммы в памяти обновляются мгновенно,
+    а события и прибавки к таблице daily записываются одной транзакцией
+    раз в STORE_FLUSH_INTERVAL. Сегодняшние суммы при чтении пользователя
+    берутся из daily, поэтому в базе они только прибавляются и не
+    перезаписываются целиком.
+
+    В памяти — до cache_size недавно активных пользователей; вытесняются
+    только пользователи без несохранённых изменений. Все чтения (пользователи
+    не из памяти, история, города, напоминания) идут в отдельном потоке через
+    своё соединение только для чтения: в WAL оно не ждёт сброса.
+    """
+
+    def __init__(self, path=USERS_DB_PATH, cache_size=STORE_CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        self._conn = None
+        self._lock = threading.Lock()
+        self._read_conn = None
+        self._read_lock = threading.Lock()
+        # Порядок — от давно использованных к недавним
+        self._users = OrderedDict()
+        # Пользователи, чей профиль ещё пишется в save_profile
+        self._saving = set()
+        self._events = []
+        self._dirty = set()
+        self._flush_task = None
+
+    def _connection(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(_SCHEMA)
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for i, migration in enumerate(_MIGRATIONS[version:], version + 1):
+                conn.executescript(f"BEGIN; {migration} PRAGMA user_version = {i}; COMMIT;")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _reader(self):
+        if self._read_conn is None:
+            # Схему и миграции создаёт соединение для записи
+            with self._lock:
+                self._connection()
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA query_only = ON")
+            self._read_conn = conn
+        return self._read_conn
+
+    def _read_users(self, user_ids):
+        with self._read_lock:
+            conn = self._reader()
+            now = int(time.time())
+            rows = [(user_id, conn.execute(_SELECT_SQL, {'now': now, 'user_id': user_id}).fetchone())
+                    for user_id in user_ids]
+        return [(user_id, row) for user_id, row in rows if row is not None]
+
+    def _cached(self, user_id):
+        user = self._users.get(user_id)
+        if user is not None:
+            self._users.move_to_end(user_id)
+            # Суммы за прошлый день остаются в daily, в памяти начинаем новый
+            user.roll_over(local_day(time.time(), user.tz_offset))
+        return user
+
+    async def get(self, user_id):
+        """Профиль пользователя с сегодняшними суммами или None, если профиля нет"""
+        user = self._cached(user_id)
+        if user is None:
+            await self._load([user_id])
+            user = self._cached(user_id)
+        return user
+
+    async def get_many(self, user_ids):
+        """{user_id: профиль} для пользователей с профилем; промахи читаются за один переход в поток"""
+        await self._load([user_id for user_id in user_ids if user_id not in self._users])
+        users = {}
+        for user_id in user_ids:
+            user = self._cached(user_id)
+            if user is not None:
+                users[user_id] = user
+        return users
+
+    async def _load(self, user_ids):
+        if not user_ids:
+            return
+        for user_id, row in await asyncio.to_thread(self._read_users, user_ids):
+            # Пока шло чтение, пользователя мог загрузить или изменить другой обработчик
+            if user_id not in self._users:
+                self._users[user_id] = UserRecord(*row)
+
+    def _evict(self):
+        """Вытесняет давно не использованных пользователей сверх cache_size"""
+        excess = len(self._users) - self.cache_size
+        if excess <= 0:
+            return
+        # Несохранённые изменения держат пользователя в памяти
+        candidates = list(islice(self._users, excess + len(self._dirty) + len(self._saving)))
+        for user_id in candidates:
+            if excess <= 0:
+                break
+            if user_id not in self._dirty and user_id not in self._saving:
+                del self._users[user_id]
+                excess -= 1
+
+    async def save_profile(self, user_id, profile):
+        """Сохраняет профиль; сегодняшние суммы сохраняются"""
+        user = UserRecord(**{field: profile[field] for field in PROFILE_FIELDS})
+        previous = await self.get(user_id)
+        if previous is not None:
+            for field in DAY_FIELDS:
+                setattr(user, field, getattr(previous, field))
+        user.roll_over(local_day(time.time(), user.tz_offset))
+        self._users[user_id] = user
+        self._users.move_to_end(user_id)
+
+        def write():
+            with self._lock:
+                conn = self._connection()
+                conn.execute(_UPSERT_SQL, (user_id, *(profile[f] for f in PROFILE_FIELDS)))
+                conn.commit()
+
+        self._saving.add(user_id)
+        try:
+            await asyncio.to_thread(write)
+        finally:
+            self._saving.discard(user_id)
+        return user
+
+    async def cities(self, owns=None):
+        """Различные города пользователей; owns(user_id) оставляет только своих"""
+        def read():
+            with self._read_lock:
+                if owns is None:
+                    return [row[0] for row in self._reader().execute(_CITIES_SQL)]
+                rows = self._reader().execute(_USER_CITIES_SQL).fetchall()
+            return list(dict.fromkeys(city for user_id, city in rows if owns(user_id)))
+
+        return await asyncio.to_thread(read)
+
+    async def update_water_goals(self, temperatures, water_norm_batch, owns=None):
+        """Пересчитывает water_goal всех пользователей за один проход.
+
+        temperatures — температура по названию города, пользователи из других
+        городов не меняются; water_norm_batch(weights, activities, temps)
+        считает нормы по столбцам; owns(user_id) ограничивает проход своими
+        пользователями. Возвращает число пользователей, у которых норма изменилась.
+        """
+        def update():
+            import numpy as np
+
+            with self._read_lock:
+                rows = self._reader().execute(_GOAL_INPUTS_SQL).fetchall()
+            if not rows:
+                return []
+
+            user_ids, weights, activities, cities, goals = zip(*rows)
+            temps = np.array([temperatures.get(city, np.nan) for city in cities])
+            new_goals = water_norm_batch(weights, activities, temps)
+
+            changed = ~np.isnan(temps) & (new_goals != np.asarray(goals))
+            if owns is not None:
+                changed &= np.fromiter(map(owns, user_ids), dtype=bool, count=len(user_ids))
+
+            changes = [
+                (int(new_goals[i]), user_ids[i], weights[i], activities[i], cities[i])
+                for i in np.flatnonzero(changed)
+            ]
+
+            with self._lock:
+                conn = self._connection()
+                with conn:
+                    conn.executemany(_UPDATE_GOAL_SQL, changes)
+            return changes
+
+        changes = await asyncio.to_thread(update)
+        for goal, user_id, weight, activity, city in changes:
+            user = self._users.get(user_id)
+            if user is not None and (user.weight, user.activity, user.city) == (weight, activity, city):
+                user.water_goal = goal
+        return len(changes)
+
+    async def history(self, user_id, first_day, last_day):
+        """Дневные суммы (день, *DAY_COUNTERS) за дни first_day <= день < last_day"""
+        def read():
+            with self._read_lock:
+                return self._reader().execute(
+                    _HISTORY_SQL, (user_id, first_day, last_day)).fetchall()
+
+        return await asyncio.to_thread(read)
+
+    async def reminder_users(self):
+        """Пользователи, включившие напоминания"""
+        def read():
+            with self._read_lock:
+                return [row[0] for row in self._reader().execute(_REMINDERS_SQL)]
+
+        return await asyncio.to_thread(read)
+
+    async def set_reminders(self, user_id, enabled):
+        def write():
+            with self._lock:
+                conn = self._connection()
+                with conn:
+                    conn.execute(_ENABLE_REMINDERS_SQL if enabled else _DISABLE_REMINDERS_SQL, (user_id,))
+
+        await asyncio.to_thread(write)
+
+    async def record(self, user_id, kind, value):
+        """Добавляет событие в журнал и сразу учитывает его в дневной сумме"""
+        return await self.record_many(user_id, [(kind, value)])
+
+    async def record_many(self, user_id, events):
+        """Несколько событий (вид, значение) сразу.
+
+        Суммы в памяти меняются без промежуточных await, а события попадают
+        в одну транзакцию сброса, поэтому набор записывается целиком или никак.
+        """
+        user = await self.get(user_id)
+        if user is None:
+            return None
+
+        ts = int(time.time())
+        for kind, value in events:
+            field = DAY_COUNTERS[kind]
+            setattr(user, field, getattr(user, field) + value)
+            self._events.append((user_id, ts, kind, value, user.day))
+        self._dirty.add(user_id)
+        return user
+
+    def _take_pending(self):
+        """Забирает накопленное; вызывается в цикле событий"""
+        events, self._events = self._events, []
+        dirty, self._dirty = self._dirty, set()
+        return events, dirty
+
+    def _restore_pending(self, events, dirty):
+        """Возвращает несохранённое, чтобы записать при следующем сбросе"""
+        self._events[:0] = events
+        self._dirty |= dirty
+
+    def _write(self, events):
+        daily = {}
+        for user_id, _, kind, value, day in events:
+            sums = daily.setdefault((user_id, day), [0] * len(DAY_COUNTERS))
+            sums[kind] += value
+
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(_INSERT_EVENT_SQL, (event[:4] for event in events))
+                conn.executemany(_UPSERT_DAILY_SQL, (
+                    (user_id, day, *sums) for (user_id, day), sums in daily.items()))
+        return len(events)
+
+    def flush(self):
+        """Записывает накопленные события одной транзакцией"""
+        if not self._events and not self._dirty:
+            return 0
+        events, dirty = self._take_pending()
+        try:
+            return self._write(events)
+        except sqlite3.Error:
+            self._restore_pending(events, dirty)
+            raise
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(STORE_FLUSH_INTERVAL)
+            if self._events or self._dirty:
+                # Забираем события в цикле событий, пишем в отдельном потоке
+                events, dirty = self._take_pending()
+                try:
+                    await asyncio.to_thread(self._write, events)
+                except sqlite3.Error as e:
+                    self._restore_pending(events, dirty)
+                    logger.error(f"Ошибка записи в базу пользователей: {e}")
+            # Записанное можно вытеснять: при следующем обращении оно прочитается из базы
+            self._evict()
+
+    async def start(self, *args):
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self, *args):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        self.flush()
+        with self._read_lock:
+            if self._read_conn is not None:
+                self._read_conn.close()
+                self._read_conn = None
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
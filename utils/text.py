@@ -0,0 +1,32 @@
+import re
+
+_NON_WORD = re.compile(r'[^\w]+')
+
+
+def normalize_text(text):
+    """Нижний регистр, ё→е, без пунктуации и лишних пробелов"""
+    text = text.lower().replace('ё', 'е')
+    return ' '.join(_NON_WORD.sub(' ', text).split())
+
+# Окончания прилагательных, существительных и глаголов; длинные проверяются первыми
+_ENDINGS = sorted((
+    'ыми', 'ими', 'ого', 'его', 'ому', 'ему', 'ами', 'ями',
+    'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ый', 'ий', 'ой', 'ей', 'ую', 'юю',
+    'ым', 'им', 'ых', 'их', 'ом', 'ем', 'ам', 'ям', 'ах', 'ях', 'ов', 'ев', 'ью',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True)
+_MIN_STEM = 3
+
+
+def stem(word):
+    """Основа русского слова: отбрасывает падежное окончание.
+
+    Упрощённый стеммер для названий продуктов: «бананы», «банана» → «банан»,
+    «варёная», «вареный» → «варен». Основа не короче трёх букв.
+    """
+    if len(word) <= _MIN_STEM:
+        return word
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM:
+            return word[:-len(ending)]
+    return word
@@ -0,0 +1,11 @@
+from telegram.request import HTTPXRequest
+
+from .metrics import track_upstream
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest, который учитывает время каждого вызова Bot API в метриках"""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        with track_upstream(f"telegram.{url.rsplit('/', 1)[-1]}"):
+            return await super().do_request(url, method, *args, **kwargs)
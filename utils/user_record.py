@@ -0,0 +1,84 @@
+import os
+
+# Смещение от UTC, если OpenWeatherMap не вернул часовой пояс города (Москва)
+DEFAULT_TZ_OFFSET = int(os.getenv("DEFAULT_TZ_OFFSET", 3 * 3600))
+
+
+def local_day(timestamp, tz_offset):
+    """Номер дня в часовом поясе пользователя"""
+    return int(timestamp + tz_offset) // 86400
+
+
+class CityTable:
+    """Интернирование названий городов: у каждого города один id и одна строка"""
+
+    def __init__(self):
+        self._ids = {}
+        self._names = []
+
+    def id_for(self, name):
+        city_id = self._ids.get(name)
+        if city_id is None:
+            city_id = len(self._names)
+            self._ids[name] = city_id
+            self._names.append(name)
+        return city_id
+
+    def name(self, city_id):
+        return self._names[city_id]
+
+    def __len__(self):
+        return len(self._names)
+
+
+cities = CityTable()
+
+
+class UserRecord:
+    """Компактная запись пользователя: слоты вместо словаря, город — по id.
+
+    Счётчики logged_* и extra_water относятся к текущему дню day.
+    """
+
+    __slots__ = ('weight', 'height', 'age', 'activity', 'city_id',
+                 'water_goal', 'calorie_goal', 'tz_offset', 'day',
+                 'logged_water', 'logged_calories', 'burned_calories', 'extra_water')
+
+    def __init__(self, weight, height, age, activity, city,
+                 water_goal=0, calorie_goal=0, tz_offset=DEFAULT_TZ_OFFSET, day=0,
+                 logged_water=0, logged_calories=0, burned_calories=0, extra_water=0):
+        self.weight = weight
+        self.height = height
+        self.age = age
+        self.activity = activity
+        self.city_id = cities.id_for(city)
+        self.water_goal = water_goal
+        self.calorie_goal = calorie_goal
+        self.tz_offset = tz_offset
+        self.day = day
+        self.logged_water = logged_water
+        self.logged_calories = logged_calories
+        self.burned_calories = burned_calories
+        self.extra_water = extra_water
+
+    @property
+    def city(self):
+        return cities.name(self.city_id)
+
+    @property
+    def day_water_goal(self):
+        """Норма воды на сегодня с учётом тренировок"""
+        return self.water_goal + self.extra_water
+
+    def roll_over(self, day):
+        """Начинает новый день, если наступил другой day"""
+        if self.day != day:
+            self.day = day
+            self.logged_water = 0
+            self.logged_calories = 0
+            self.burned_calories = 0
+            self.extra_water = 0
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"UserRecord({fields})"
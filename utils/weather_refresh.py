@@ -0,0 +1,91 @@
+"""Периодическое обновление погоды и норм воды всех пользователей.
+
+Раз в WEATHER_REFRESH_INTERVAL берутся различные города из базы, для каждого
+города один раз запрашивается температура, и погодная часть water_goal
+пересчитывается для всех пользователей одним пакетным проходом. Число
+запросов к OpenWeatherMap зависит от числа городов, а не пользователей.
+В режиме sharded обработчик запрашивает только города своих пользователей.
+"""
+import asyncio
+import logging
+import os
+import time
+
+from .calculations import city_key, get_weather, water_norm_batch
+
+logger = logging.getLogger(__name__)
+
+# Период обновления, сек; 0 отключает обновление
+WEATHER_REFRESH_INTERVAL = float(os.getenv("WEATHER_REFRESH_INTERVAL", 3 * 3600))
+# Сколько городов запрашивать одновременно
+WEATHER_REFRESH_CONCURRENCY = int(os.getenv("WEATHER_REFRESH_CONCURRENCY", 5))
+
+
+class WeatherRefresher:
+    """Фоновая задача обновления норм воды для хранилища store.
+
+    owns(user_id) ограничивает пересчёт пользователями этого процесса
+    (в режиме sharded у каждого обработчика свои пользователи в памяти).
+    """
+
+    def __init__(self, store, interval=WEATHER_REFRESH_INTERVAL,
+                 concurrency=WEATHER_REFRESH_CONCURRENCY, owns=None):
+        self.store = store
+        self.interval = interval
+        self.concurrency = concurrency
+        self.owns = owns
+        self._task = None
+
+    async def refresh(self):
+        """Один проход: возвращает (число городов, число изменённых норм)"""
+        started = time.perf_counter()
+
+        # Разные написания одного города запрашиваются один раз
+        by_key = {}
+        for city in await self.store.cities(self.owns):
+            by_key.setdefault(city_key(city), []).append(city)
+
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(city):
+            async with slots:
+                return await get_weather(city, refresh=True)
+
+        names = [spellings[0] for spellings in by_key.values()]
+        weather = await asyncio.gather(*(fetch(city) for city in names))
+
+        temperatures = {}
+        for spellings, result in zip(by_key.values(), weather):
+            # Без свежей температуры норму не меняем
+            if result is not None:
+                for city in spellings:
+                    temperatures[city] = result['temp']
+
+        updated = await self.store.update_water_goals(temperatures, water_norm_batch, self.owns)
+        logger.info(
+            "Погода обновлена", extra={
+                'cities': len(names), 'fetched': len(set(map(city_key, temperatures))),
+                'updated_users': updated,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 1)})
+        return len(names), updated
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Ошибка обновления погоды: {e}")
+
+    async def start(self, *args):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def close(self, *args):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
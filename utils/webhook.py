@@ -0,0 +1,120 @@
+"""Встроенный HTTP-сервер для приёма обновлений Telegram через вебхук.
+
+Вебхук принимает один процесс: пользователи в UserStore, user_data и
+состояния диалогов живут в памяти процесса, поэтому обновления одного
+пользователя, разнесённые по нескольким репликам, теряли бы прибавки и
+обрывали диалоги. Несколько процессов — только BOT_MODE=sharded с
+SHARDED_INPUT=webhook: фронт принимает вебхук и отдаёт пользователя всегда
+одному и тому же обработчику.
+
+Локальная проверка — отправить записанное обновление:
+    curl -X POST localhost:8080/telegram -H 'Content-Type: application/json' -d @update.json
+"""
+import asyncio
+import hmac
+import logging
+import os
+import signal
+
+from aiohttp import web
+
+from .metrics import handle_metrics
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+# Публичный адрес, который регистрируется в Telegram; без него вебхук не ставится
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+# Сколько ждать завершения принятых обновлений при остановке, сек
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", 30))
+
+
+class WebhookServer:
+    """Принимает обновления по HTTP и передаёт их в on_update(data).
+
+    GET /healthz отвечает 200, пока сервер принимает обновления, и 503 во время
+    остановки. GET /metrics отдаёт метрики процесса.
+    """
+
+    def __init__(self, on_update, path=WEBHOOK_PATH, secret=WEBHOOK_SECRET,
+                 listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT):
+        self.on_update = on_update
+        self.secret = secret
+        self.listen = listen
+        self.port = port
+        self.in_flight = 0
+        self.draining = False
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+        self.app = web.Application()
+        self.app.router.add_post(path, self._handle_update)
+        self.app.router.add_get('/healthz', self._handle_health)
+        self.app.router.add_get('/metrics', handle_metrics)
+        self._runner = None
+
+    async def _handle_update(self, request):
+        if self.draining:
+            # Telegram повторит доставку; вебхук остаётся зарегистрированным,
+            # и обновление получит перезапущенный процесс
+            return web.Response(status=503)
+
+        if self.secret:
+            token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+            if not hmac.compare_digest(token, self.secret):
+                return web.Response(status=403)
+
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+
+        self.in_flight += 1
+        self._idle.clear()
+        try:
+            await self.on_update(data)
+        except Exception as e:
+            logger.error(f"Ошибка обработки обновления из вебхука: {e}")
+            return web.Response(status=500)
+        finally:
+            self.in_flight -= 1
+            if not self.in_flight:
+                self._idle.set()
+
+        return web.Response()
+
+    async def _handle_health(self, request):
+        status = 503 if self.draining else 200
+        return web.json_response(
+            {'status': 'draining' if self.draining else 'ok', 'in_flight': self.in_flight},
+            status=status
+        )
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, handle_signals=False)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        logger.info(f"Вебхук слушает {self.listen}:{self.port}")
+
+    async def stop(self, timeout=WEBHOOK_DRAIN_TIMEOUT):
+        """Перестаёт принимать обновления и ждёт уже принятые"""
+        self.draining = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Остановка вебхука: не дождались {self.in_flight} обновлений")
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def wait_for_stop_signal():
+    """Ждёт SIGINT или SIGTERM"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()